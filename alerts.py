@@ -0,0 +1,208 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from instrumentation import instruments
+from signals import RULES_BY_KEY, rule_params
+
+load_dotenv()
+
+# Gmail 发信者帐号设置
+SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL")
+# 可指向本机的测试 SMTP（如 python -m aiosmtpd -n -l localhost:1025 搭配 SMTP_SSL=0）
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_SSL = os.getenv("SMTP_SSL", "1") != "0"
+
+EMAIL_FOOTER = "\n系統偵測到異常變動，請立即查看市場情況。"
+
+# 页面与通知中显示的异动提醒文字；fired 为触发的规则键名，文字取自规则注册表
+def build_alert_message(ticker, price_pct_change, volume_pct_change, fired=(), config=None):
+    alert_msg = f"{ticker} 異動：價格 {price_pct_change:.2f}%、成交量 {volume_pct_change:.2f}%"
+    for key in fired:
+        rule = RULES_BY_KEY[key]
+        alert_msg += "，" + rule.alert.format(**rule_params(rule, config))
+    return alert_msg
+
+# 单一代号的邮件内容
+def build_email_body(ticker, price_pct, volume_pct, fired=(), config=None):
+    body = f"""
+    股票代號：{ticker}
+    股價變動：{price_pct:.2f}%
+    成交量變動：{volume_pct:.2f}%
+    """
+    for key in fired:
+        rule = RULES_BY_KEY[key]
+        body += "\n" + rule.email.format(**rule_params(rule, config))
+    return body
+
+# smtplib 与 MIME 模块在第一次发信时才载入，页面没有异动时不必付出载入成本
+def connect_smtp(host=None, port=None, use_ssl=None):
+    import smtplib
+    host, port = host or SMTP_HOST, port or SMTP_PORT
+    use_ssl = SMTP_SSL if use_ssl is None else use_ssl
+    server = smtplib.SMTP_SSL(host, port, timeout=30) if use_ssl else smtplib.SMTP(host, port, timeout=30)
+    if SENDER_PASSWORD:
+        server.login(SENDER_EMAIL, SENDER_PASSWORD)
+    return server
+
+def build_message(subject, body):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    msg = MIMEMultipart()
+    msg["From"] = SENDER_EMAIL
+    msg["To"] = RECIPIENT_EMAIL
+    msg["Subject"] = subject
+    msg.attach(MIMEText(body + EMAIL_FOOTER, "plain"))
+    return msg
+
+# 同一 (代号, 信号, K 线时间) 在此时间内（秒）只通知一次
+DEDUPE_TTL = 6 * 3600
+# 连线闲置超过此时间（秒）就主动关闭，下次发送再重连
+SMTP_IDLE_TIMEOUT = 60
+# 摘要发送失败时，其中的提醒并入之后的摘要重送的最多次数；超过后放弃并取消去重记录
+DIGEST_RETRIES = 3
+
+# 背景发信：页面/监控程序只把提醒放入队列，每轮合并成一封摘要，
+# 由单一工作线程沿用同一条已登录的 SMTP 连线发送
+class AlertDispatcher:
+    def __init__(self, connect=connect_smtp, dedupe_ttl=DEDUPE_TTL, idle_timeout=SMTP_IDLE_TIMEOUT,
+                 retries=DIGEST_RETRIES):
+        self.connect = connect
+        self.dedupe_ttl = dedupe_ttl
+        self.idle_timeout = idle_timeout
+        self.retries = retries
+        self._queue = queue.Queue()
+        self._pending = []
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.sent = 0
+        self.failed = 0
+        self.suppressed = 0
+        self.connections = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=100)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    # 加入一则提醒；已在 TTL 内通知过（或正在发送）的信号会被略过，全部重复时返回 False
+    def submit(self, ticker, price_pct, volume_pct, fired, bar_time=None, price_volume=False, config=None):
+        fired = list(fired)
+        if price_volume:
+            fired.append("volume_price")
+        now = time.monotonic()
+        with self._lock:
+            self._seen = {key: expiry for key, expiry in self._seen.items() if expiry > now}
+            fresh = [name for name in fired if (ticker, name, bar_time) not in self._seen]
+            if not fresh:
+                self.suppressed += 1
+                return False
+            keys = [(ticker, name, bar_time) for name in fresh]
+            for key in keys:
+                self._seen[key] = now + self.dedupe_ttl
+            # 只保留本次新出现的信号；量價异动体现在摘要标题行，不另列文字
+            new_signals = [name for name in fresh if name != "volume_price"]
+            # 末两项为去重键与已失败次数，发送失败时据此重送或取消去重
+            self._pending.append((ticker, price_pct, volume_pct, new_signals, config, keys, 0))
+            return True
+
+    # 一轮结束：把本轮累积的提醒合并成一封摘要放入发送队列
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            self._queue.put(pending)
+        return len(pending)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        return {
+            "queue_depth": self.queue_depth(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "suppressed": self.suppressed,
+            "connections": self.connections,
+            "last_latency": self.latencies[-1] if latencies else None,
+            "p95_latency": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None,
+            "last_error": self.last_error,
+        }
+
+    # 等待队列送完后关闭连线
+    def close(self, timeout=30):
+        self.flush()
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._disconnect()
+
+    def _run(self):
+        while True:
+            try:
+                batch = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            if batch is None:
+                return
+            self._send_digest(batch)
+
+    def _send_digest(self, batch):
+        tickers = list(dict.fromkeys(ticker for ticker, *_ in batch))
+        body = "\n".join(build_email_body(ticker, price_pct, volume_pct, fired, config)
+                         for ticker, price_pct, volume_pct, fired, config, *_ in batch)
+        msg = build_message(f"📣 股票異動通知：{'、'.join(tickers)}", body)
+        started = time.perf_counter()
+        # 连线可能已被服务器关闭，失败时重连再试一次
+        for attempt in range(2):
+            try:
+                if self._server is None:
+                    self._server = self.connect()
+                    self.connections += 1
+                self._server.sendmail(SENDER_EMAIL, RECIPIENT_EMAIL, msg.as_string())
+                self.sent += 1
+                self.last_error = None
+                self.latencies.append(time.perf_counter() - started)
+                instruments.observe("smtp", self.latencies[-1])
+                instruments.count("emails_sent")
+                return
+            except Exception as e:
+                self._disconnect()
+                if attempt:
+                    self.failed += 1
+                    self.last_error = e
+                    instruments.count("emails_failed")
+                    self._requeue(batch)
+
+    # 发送失败的提醒并入下一封摘要；重试次数用完的取消去重记录，之后再次提交时仍会通知
+    def _requeue(self, batch):
+        retry, dropped = [], []
+        for *entry, keys, failures in batch:
+            (retry if failures + 1 < self.retries else dropped).append((*entry, keys, failures + 1))
+        with self._lock:
+            self._pending = retry + self._pending
+            for *_, keys, _ in dropped:
+                for key in keys:
+                    self._seen.pop(key, None)
+
+    def _disconnect(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
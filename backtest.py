@@ -0,0 +1,272 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from fetcher import YFinanceProvider, fetch_watchlist
+from indicators import add_indicators
+from monitor import add_rule_arguments, rule_config_from_args
+from signals import RULES_BY_KEY, compute_signals
+
+# 回测：python -m v2 backtest bars/ --horizons 1,5,20
+# 读取已缓存的 K 线文件（页面下载的 CSV、监控程序 --cache-dir 的 Parquet），
+# 用与页面相同的规则计算每笔信号之后 N 根 K 线的报酬与命中率
+
+DEFAULT_HORIZONS = (1, 5, 20)
+BAR_SUFFIXES = (".csv", ".parquet", ".feather")
+# 基准列：所有 K 线的无条件报酬，用来比较信号是否优于随机进场
+BASELINE = "all"
+BAR_COLUMNS = ["Datetime", "Open", "High", "Low", "Close", "Volume"]
+# 各间隔一根 K 线的长度，用来从 K 线间距判断文件的间隔；1h 与 60m 视为同一间隔
+INTERVAL_SPANS = {
+    "1m": pd.Timedelta(minutes=1), "2m": pd.Timedelta(minutes=2), "5m": pd.Timedelta(minutes=5),
+    "15m": pd.Timedelta(minutes=15), "30m": pd.Timedelta(minutes=30), "60m": pd.Timedelta(minutes=60),
+    "90m": pd.Timedelta(minutes=90), "1d": pd.Timedelta(days=1), "5d": pd.Timedelta(days=5),
+    "1wk": pd.Timedelta(days=7), "1mo": pd.Timedelta(days=30), "3mo": pd.Timedelta(days=91),
+}
+INTERVAL_ALIASES = {"1h": "60m"}
+
+# 文件名第一段为代号：TSLA_數據_20250101_093000.csv、TSLA_max_1d.parquet
+def ticker_from_path(path):
+    return os.path.basename(path).split("_")[0].split(".")[0].upper()
+
+# 监控程序与 --download 的文件名为 {代号}_{期间}_{间隔}，最后一段即间隔；其他文件返回 None
+def interval_from_path(path):
+    parts = os.path.splitext(os.path.basename(path))[0].split("_")
+    interval = INTERVAL_ALIASES.get(parts[-1], parts[-1]) if len(parts) >= 3 else None
+    return interval if interval in INTERVAL_SPANS else None
+
+# 以相邻 K 线时间差的中位数判断间隔（周末与收盘间隔不影响中位数），取长度最接近的已知间隔
+def infer_interval(times):
+    if len(times) < 2:
+        return None
+    spacing = times.diff().median()
+    return min(INTERVAL_SPANS, key=lambda interval: abs(np.log(spacing / INTERVAL_SPANS[interval])))
+
+# 文件的间隔：文件名没有标明时（页面下载的 CSV）读取文件从 K 线间距判断
+def bar_interval(path):
+    interval = interval_from_path(path)
+    if interval is None:
+        data = read_bars(path)
+        interval = infer_interval(data["Datetime"]) if "Datetime" in data.columns else None
+    return interval
+
+def find_bar_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith(BAR_SUFFIXES)))
+        else:
+            files.append(path)
+    return files
+
+# 读取单一文件的原始 K 线；时间统一为 UTC，同一代号的多个文件才能合并排序
+def read_bars(path):
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == ".csv":
+        data = pd.read_csv(path, usecols=lambda c: c in BAR_COLUMNS or c == "Date")
+    elif suffix == ".feather":
+        data = pd.read_feather(path)
+    else:
+        data = pd.read_parquet(path)
+    data = data.rename(columns={"Date": "Datetime"})
+    data = data[[c for c in BAR_COLUMNS if c in data.columns]].dropna(subset=["Close"])
+    if "Datetime" in data.columns:
+        data = data.assign(Datetime=pd.to_datetime(data["Datetime"], utc=True))
+    return data.reset_index(drop=True)
+
+# 读取同一代号的所有文件并合并：页面下载的 CSV 是同一段历史的重叠快照，
+# 时间相同的 K 线只保留最后读到的一笔，再重新计算指标（文件里已有的指标列可能来自旧版本，一律重算）
+def load_bars(paths):
+    frames = [read_bars(path) for path in ([paths] if isinstance(paths, str) else paths)]
+    data = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if "Datetime" in data.columns:
+        data = data.drop_duplicates("Datetime", keep="last").sort_values("Datetime", kind="stable")
+    return add_indicators(data.reset_index(drop=True))
+
+# 第 i 笔之后 h 根 K 线的报酬，形状为 (持有期数, K 线数)，末端不足 h 根者为 NaN
+def forward_returns(close, horizons):
+    returns = np.full((len(horizons), len(close)), np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for row, h in enumerate(horizons):
+            if h < len(close):
+                returns[row, :-h] = close[h:] / close[:-h] - 1
+    return returns
+
+# 单一代号的回测统计：各规则 × 持有期的次数、命中数、报酬和与平方和，可直接跨代号相加
+def backtest_frame(data, horizons=DEFAULT_HORIZONS, price_threshold=80.0, volume_threshold=80.0, config=None):
+    flags = compute_signals(data, price_threshold, volume_threshold, config)
+    keys = list(flags.columns) + [BASELINE]
+    fired = np.vstack([flags.to_numpy(dtype=float).T, np.ones(len(data))])
+    directions = np.array([RULES_BY_KEY[key].direction for key in flags.columns] + [1])
+
+    returns = forward_returns(data["Close"].to_numpy(dtype=float), horizons)
+    valid = ~np.isnan(returns)
+    filled = np.where(valid, returns, 0.0)
+    # 没有预期方向的规则（量價），以波动超过该代号报酬绝对值的中位数为命中
+    moves = np.abs(filled)
+    median_move = np.array([[np.median(m[v]) if v.any() else np.inf] for m, v in zip(moves, valid)])
+    hits = {
+        1: fired @ (filled > 0).T,
+        -1: fired @ (filled < 0).T,
+        0: fired @ (moves > median_move).T,
+    }
+    return {
+        "keys": keys,
+        "bars": len(data),
+        "count": fired @ valid.T,
+        "hits": np.select([directions[:, None] == d for d in (1, -1)], [hits[1], hits[-1]], hits[0]),
+        "total": fired @ filled.T,
+        "total_sq": fired @ (filled ** 2).T,
+    }
+
+# 进程池的工作函数：同一 (代号, 间隔) 的所有文件合并后回测，返回 ((代号, 间隔), 统计, 错误)，
+# 错误不会中断整批回测
+def backtest_ticker(key, paths, **kwargs):
+    try:
+        data = load_bars(paths)
+        if len(data) < 2:
+            return key, None, f"{', '.join(paths)} 數據不足"
+        return key, backtest_frame(data, **kwargs), None
+    except Exception as e:
+        return key, None, f"{', '.join(paths)}：{e}"
+
+# 按 (代号, 间隔) 分组后分派到进程池：同一代号同一间隔的重叠文件只计算一次，
+# 不同间隔（如监控程序 --cache-dir 同时写入的 TSLA_max_1d 与 TSLA_5d_5m）绝不合并成同一序列
+def run_backtest(paths, horizons=DEFAULT_HORIZONS, price_threshold=80.0, volume_threshold=80.0,
+                 config=None, workers=None):
+    groups = {}
+    for path in paths:
+        try:
+            interval = bar_interval(path)
+        except Exception:
+            # 读不到的文件单独成组，交给工作函数回报错误
+            interval = os.path.basename(path)
+        groups.setdefault((ticker_from_path(path), interval), []).append(path)
+    worker = partial(_backtest_group, horizons=tuple(horizons), price_threshold=price_threshold,
+                     volume_threshold=volume_threshold, config=config)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(groups) <= 1:
+        return _collect(map(worker, groups.items()))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return _collect(executor.map(worker, groups.items(), chunksize=max(1, len(groups) // (workers * 4))))
+
+def _backtest_group(group, **kwargs):
+    return backtest_ticker(*group, **kwargs)
+
+def _collect(outcomes):
+    stats, errors = {}, {}
+    for key, result, error in outcomes:
+        if error is not None:
+            errors[key] = error
+        else:
+            stats[key] = result
+    return stats, errors
+
+# 汇总所有代号：每个间隔 × 信号 × 持有期一列；持有期以 K 线数计，不同间隔分开统计
+def summarize(stats, horizons=DEFAULT_HORIZONS):
+    if not stats:
+        return pd.DataFrame()
+    by_interval = {}
+    for (_, interval), result in stats.items():
+        by_interval.setdefault(interval, []).append(result)
+    rows = []
+    for interval, results in by_interval.items():
+        rows.extend(_summary_rows(interval, results, horizons))
+    return pd.DataFrame(rows)
+
+def _summary_rows(interval, results, horizons):
+    keys = results[0]["keys"]
+    count, hits, total, total_sq = (sum(s[f] for s in results) for f in ("count", "hits", "total", "total_sq"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean ** 2, 0))
+        hit_rate = hits / count
+    baseline = keys.index(BASELINE)
+    rows = []
+    for i, key in enumerate(keys):
+        for j, h in enumerate(horizons):
+            rows.append({
+                "間隔": interval,
+                "訊號": "全部 K 線（基準）" if key == BASELINE else RULES_BY_KEY[key].label,
+                "持有 K 線數": h,
+                "次數": int(count[i, j]),
+                "命中率 %": hit_rate[i, j] * 100,
+                "平均報酬 %": mean[i, j] * 100,
+                "報酬標準差 %": std[i, j] * 100,
+                "超額報酬 %": (mean[i, j] - mean[baseline, j]) * 100,
+            })
+    return rows
+
+# 先下载整段历史存成 Parquet，之后即可离线重复回测
+def download_bars(tickers, period, interval, data_dir, provider=None):
+    os.makedirs(data_dir, exist_ok=True)
+    frames, errors = fetch_watchlist(tickers, period, interval, provider=provider or YFinanceProvider())
+    paths = []
+    for ticker, data in frames.items():
+        path = os.path.join(data_dir, f"{ticker}_{period}_{interval}.parquet")
+        data.to_parquet(path, index=False)
+        paths.append(path)
+    return paths, errors
+
+def parse_horizons(value):
+    horizons = [int(h) for h in value.split(",") if h.strip()]
+    if not horizons or min(horizons) < 1:
+        raise argparse.ArgumentTypeError("持有 K 線數須為正整數，如 1,5,20")
+    return horizons
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m v2 backtest", description="以現有訊號規則回測歷史 K 線")
+    parser.add_argument("paths", nargs="*", default=["."], help="K 線檔案或目錄（CSV / Parquet / Feather）")
+    parser.add_argument("--horizons", type=parse_horizons, default=list(DEFAULT_HORIZONS), help="持有 K 線數，逗號分隔")
+    parser.add_argument("--price-threshold", type=float, default=80.0, help="價格異動閾值 (%%)")
+    parser.add_argument("--volume-threshold", type=float, default=80.0, help="成交量異動閾值 (%%)")
+    add_rule_arguments(parser)
+    parser.add_argument("--workers", type=int, help="行程數，預設為 CPU 核心數")
+    parser.add_argument("--download", metavar="TICKERS", help="先下載這些代號（逗號分隔）到第一個路徑再回測")
+    parser.add_argument("--period", default="max", help="--download 的時間範圍")
+    parser.add_argument("--interval", default="1d", help="--download 的資料間隔")
+    parser.add_argument("--output", help="結果另存為 CSV 或 Parquet")
+    args = parser.parse_args(argv)
+    args.rule_config = rule_config_from_args(parser, args)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.download:
+        tickers = [t.strip().upper() for t in args.download.split(",") if t.strip()]
+        paths, errors = download_bars(tickers, args.period, args.interval, args.paths[0])
+        for ticker, error in errors.items():
+            print(f"⚠️ 無法下載 {ticker}：{error}")
+        print(f"已下載 {len(paths)} 檔到 {args.paths[0]}")
+
+    paths = find_bar_files(args.paths)
+    if not paths:
+        print("找不到 K 線檔案（.csv / .parquet / .feather）")
+        return 1
+    started = time.perf_counter()
+    stats, errors = run_backtest(paths, args.horizons, args.price_threshold, args.volume_threshold,
+                                 args.rule_config, args.workers)
+    elapsed = time.perf_counter() - started
+    for (ticker, interval), error in errors.items():
+        print(f"⚠️ {ticker}（{interval}）略過：{error}")
+
+    summary = summarize(stats, args.horizons)
+    bars = sum(s["bars"] for s in stats.values())
+    print(f"回測 {len({ticker for ticker, _ in stats})} 檔、{len(stats)} 組（代號 × 間隔）、{bars:,} 根 K 線，耗時 {elapsed:.2f} 秒")
+    if not summary.empty:
+        print(summary.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    if args.output and not summary.empty:
+        if args.output.endswith(".parquet"):
+            summary.to_parquet(args.output, index=False)
+        else:
+            summary.to_csv(args.output, index=False)
+    return 0 if stats else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,233 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instruments
+from fetcher import fetch_watchlist
+from indicators import ROLLING_WINDOW, add_indicators, update_indicators
+
+# 各间隔的保留上限：(最长保留时间, 最多 K 线数)
+RETENTION = {
+    "1m": (timedelta(days=8), 5_000),
+    "2m": (timedelta(days=60), 12_000),
+    "5m": (timedelta(days=60), 12_000),
+    "15m": (timedelta(days=60), 8_000),
+    "30m": (timedelta(days=60), 8_000),
+    "60m": (timedelta(days=730), 12_000),
+    "90m": (timedelta(days=60), 8_000),
+    "1h": (timedelta(days=730), 12_000),
+    "1d": (timedelta(days=365 * 50), 20_000),
+    "5d": (timedelta(days=365 * 50), 5_000),
+    "1wk": (timedelta(days=365 * 50), 5_000),
+    "1mo": (timedelta(days=365 * 50), 2_000),
+    "3mo": (timedelta(days=365 * 50), 1_000),
+}
+MAX_ENTRIES = 500
+
+# 期间对应的日历范围；"Nd" 按交易日计（与 yfinance 相同），ytd 为当年，max 不裁
+PERIOD_OFFSETS = {"mo": "months", "y": "years"}
+
+# 只保留所选期间内的 K 线：返回第一笔应保留的位置；times 为按时间排序的 Datetime 列
+def period_start(period, times):
+    if times.empty or period in (None, "max"):
+        return 0
+    if period == "ytd":
+        last = times.iloc[-1]
+        return int(times.searchsorted(last.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)))
+    match = re.fullmatch(r"(\d+)(d|mo|y)", period)
+    if match is None:
+        return 0
+    count, unit = int(match.group(1)), match.group(2)
+    if unit == "d":
+        # 找出最后 count 个交易日的起点
+        dates = times.dt.normalize().to_numpy()
+        starts = np.flatnonzero(dates[1:] != dates[:-1]) + 1
+        return int(starts[-count]) if len(starts) >= count else 0
+    cutoff = times.iloc[-1] - pd.DateOffset(**{PERIOD_OFFSETS[unit]: count})
+    return int(times.searchsorted(cutoff, side="right"))
+
+# 每个 (代号, 期间, 间隔) 一份含指标的 K 线，刷新时只抓取并重算最后一笔之后的资料。
+# 指标计算为 O(新 K 线数)，但合并后的整段历史仍以 pd.concat 复制一次，设定 cache_dir 时
+# 也会重写整个文件，因此每次刷新仍有 O(保留 K 线数) 的复制成本，由 RETENTION 限制其大小
+class BarStore:
+    def __init__(self, cache_dir=None, file_format="parquet", retention=RETENTION, max_entries=MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.file_format = file_format
+        self.retention = retention
+        self.max_entries = max_entries
+        # 以 (代号, 期间, 间隔) 为键，不同期间各存一份，多个页面使用不同期间时不会互相挤掉
+        self._bars = OrderedDict()
+        # 各键最近一次向数据源抓取的时间（time.monotonic）
+        self._fetched = {}
+        # 并行刷新时多个线程会同时读写缓存
+        self._lock = threading.RLock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._bars)
+
+    def _path(self, ticker, period, interval):
+        return os.path.join(self.cache_dir, f"{ticker}_{period}_{interval}.{self.file_format}")
+
+    def _load(self, ticker, period, interval):
+        if not self.cache_dir:
+            return None
+        path = self._path(ticker, period, interval)
+        if not os.path.exists(path):
+            return None
+        try:
+            if self.file_format == "feather":
+                return pd.read_feather(path)
+            return pd.read_parquet(path)
+        except Exception:
+            return None
+
+    def _save(self, ticker, period, interval, data):
+        if not self.cache_dir:
+            return
+        path = self._path(ticker, period, interval)
+        try:
+            if self.file_format == "feather":
+                data.to_feather(path)
+            else:
+                data.to_parquet(path, index=False)
+        except ImportError:
+            # 未安装 pyarrow 时只保留内存缓存
+            self.cache_dir = None
+
+    # 内存中没有时从磁盘缓存载入
+    def get(self, ticker, period, interval):
+        key = (ticker, period, interval)
+        with self._lock:
+            data = self._bars.get(key)
+            if data is None:
+                data = self._load(ticker, period, interval)
+                if data is None:
+                    return None
+                self._put(key, data)
+            self._bars.move_to_end(key)
+            return data
+
+    def last_timestamp(self, ticker, period, interval):
+        data = self._bars.get((ticker, period, interval))
+        return None if data is None or data.empty else data["Datetime"].iloc[-1]
+
+    def _put(self, key, data):
+        with self._lock:
+            self._bars[key] = data
+            self._bars.move_to_end(key)
+            while len(self._bars) > self.max_entries:
+                old_key, _ = self._bars.popitem(last=False)
+                self._fetched.pop(old_key, None)
+
+    # 以完整历史取代缓存
+    def replace(self, ticker, period, interval, bars):
+        data = add_indicators(bars.reset_index(drop=True))
+        data = self._evict(period, interval, data)
+        self._put((ticker, period, interval), data)
+        self._save(ticker, period, interval, data)
+        return data
+
+    # 合并新 K 线：时间戳重叠的（尚未收盘的最后一笔）以新资料覆盖，并接续计算指标
+    def merge(self, ticker, period, interval, bars):
+        key = (ticker, period, interval)
+        cached = self._bars.get(key)
+        if cached is None or cached.empty:
+            return self.replace(ticker, period, interval, bars)
+        if bars.empty:
+            return cached
+        tz = cached["Datetime"].dt.tz
+        if bars["Datetime"].dt.tz != tz:
+            # 批量下载与逐档抓取的时区可能不同，统一为缓存的时区
+            bars = bars.assign(Datetime=bars["Datetime"].dt.tz_convert(tz) if tz else bars["Datetime"].dt.tz_localize(None))
+        # 批量抓取以清单中最旧的最后时间为起点，其他代号会收到缓存最后一笔之前的 K 线；
+        # 这些已收盘的 K 线丢弃，接续计算总是从缓存的指标状态开始（只保留尾段时也一样）
+        bars = bars[bars["Datetime"] >= cached["Datetime"].iloc[-1]]
+        if bars.empty:
+            return cached
+        cut = cached["Datetime"].searchsorted(bars["Datetime"].iloc[0])
+        kept = cached.iloc[:cut]
+        # 只把前 ROLLING_WINDOW 笔（含 EMA 状态）与新 K 线一起重算，再接回缓存
+        context = kept.iloc[-ROLLING_WINDOW:]
+        fresh = update_indicators(pd.concat([context, bars], ignore_index=True), len(context))
+        new = fresh.iloc[len(context):]
+        # 超出保留笔数的前段在拼接前就切掉（切片不复制），整段历史只复制一次
+        max_rows = self.retention.get(interval, (None, None))[1]
+        if max_rows is not None:
+            kept = kept.iloc[max(0, len(kept) + len(new) - max_rows):]
+        data = self._evict(period, interval, pd.concat([kept, new], ignore_index=True))
+        self._put(key, data)
+        self._save(ticker, period, interval, data)
+        return data
+
+    # 裁掉所选期间以外、以及超过间隔保留上限的 K 线，缓存内容因此与重新抓取整个期间相同；
+    # 指标状态在保留下来的列中，裁掉前段不影响后续接续计算。
+    # K 线按时间排序，以 searchsorted 找出起点，没有需要裁掉的就不再复制
+    def _evict(self, period, interval, data):
+        max_age, max_rows = self.retention.get(interval, (None, None))
+        first = period_start(period, data["Datetime"]) if "Datetime" in data.columns else 0
+        if max_age is not None and not data.empty:
+            first = max(first, int(data["Datetime"].searchsorted(data["Datetime"].iloc[-1] - max_age)))
+        if max_rows is not None:
+            first = max(first, len(data) - max_rows)
+        if first <= 0:
+            return data
+        # 复制一份，切片不会留住整段旧资料的缓冲区
+        return data.iloc[first:].reset_index(drop=True).copy()
+
+    def _is_fresh(self, key, now, max_age):
+        fetched = self._fetched.get(key)
+        return max_age is not None and fetched is not None and now - fetched < max_age and key in self._bars
+
+    # 刷新自选清单：无缓存的代号抓整段历史，其余只抓最后一笔之后的 K 线；
+    # 给定 max_age（秒）时，在此时间内抓过的代号直接沿用缓存，不向数据源请求
+    def refresh(self, tickers, period, interval, provider=None, max_age=None):
+        tickers = list(dict.fromkeys(tickers))
+        now = time.monotonic()
+        with self._lock:
+            stale = [t for t in tickers if not self._is_fresh((t, period, interval), now, max_age)]
+        if len(stale) < len(tickers):
+            instruments.count("fetch_cached", len(tickers) - len(stale))
+        full = [t for t in stale if self.get(t, period, interval) is None]
+        incremental = [t for t in stale if t not in full]
+        errors = {}
+        # 单一代号时计时归到该代号名下
+        label = tickers[0] if len(tickers) == 1 else None
+
+        if full:
+            instruments.count("fetch_full", len(full))
+            with instruments.stage("fetch", label):
+                frames, fetch_errors = fetch_watchlist(full, period, interval, provider=provider)
+            errors.update(fetch_errors)
+            with instruments.stage("indicators", label):
+                for ticker, bars in frames.items():
+                    if not bars.empty and "Datetime" in bars.columns:
+                        self.replace(ticker, period, interval, bars)
+
+        if incremental:
+            instruments.count("fetch_incremental", len(incremental))
+            start = min(self.last_timestamp(t, period, interval) for t in incremental)
+            with instruments.stage("fetch", label):
+                frames, fetch_errors = fetch_watchlist(incremental, period, interval, provider=provider, start=start)
+            errors.update(fetch_errors)
+            with instruments.stage("indicators", label):
+                for ticker, bars in frames.items():
+                    if not bars.empty and "Datetime" in bars.columns:
+                        self.merge(ticker, period, interval, bars)
+
+        frames = {}
+        with self._lock:
+            for ticker in stale:
+                if ticker not in errors and (ticker, period, interval) in self._bars:
+                    self._fetched[(ticker, period, interval)] = now
+            for ticker in tickers:
+                data = self._bars.get((ticker, period, interval))
+                frames[ticker] = data if data is not None else pd.DataFrame()
+        return frames, errors
@@ -0,0 +1,493 @@
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+
+from alerts import AlertDispatcher
+from backtest import find_bar_files, run_backtest, summarize
+from bar_cache import BarStore
+from exports import EXPORT_FORMATS, export_watchlist
+from charts import ChartCache, payload_size, sparkline_table, svg_figure, webgl_figure
+from fetcher import FakeProvider, fetch_watchlist, make_bars
+from indicators import INDICATOR_COLUMNS, add_indicators
+from instrumentation import Instrumentation
+from pipeline import run_refresh
+from screener import Screener
+from signals import RULES, FrameContext, Rule, analyze_ticker, compute_signals, evaluate_rules, mark_signals, latest_signals, with_thresholds
+
+# 性能基准：python bench.py [signals] [rules] [fetch] [cache] [pipeline] [alerts] [backtest] [charts] [export] [instruments] [screener] [startup]
+
+# 旧版逐列 iterrows 的 mark_signal，作为对照组
+def legacy_mark_signals(data, price_threshold, volume_threshold):
+    def mark_signal(row, index):
+        signals = []
+        if abs(row["📈 股價漲跌幅 (%)"]) >= price_threshold and abs(row["📊 成交量變動幅 (%)"]) >= volume_threshold:
+            signals.append("✅ 量價")
+        if index > 0 and row["Low"] > data["High"].iloc[index-1]:
+            signals.append("📈 Low>High")
+        if index > 0 and row["High"] < data["Low"].iloc[index-1]:
+            signals.append("📉 High<Low")
+        if index > 0 and row["MACD"] > 0 and data["MACD"].iloc[index-1] <= 0:
+            signals.append("📈 MACD買入")
+        if index > 0 and row["MACD"] <= 0 and data["MACD"].iloc[index-1] > 0:
+            signals.append("📉 MACD賣出")
+        if (index > 0 and row["EMA5"] > row["EMA10"] and
+            data["EMA5"].iloc[index-1] <= data["EMA10"].iloc[index-1] and
+            row["Volume"] > data["Volume"].iloc[index-1]):
+            signals.append("📈 EMA買入")
+        if (index > 0 and row["EMA5"] < row["EMA10"] and
+            data["EMA5"].iloc[index-1] >= data["EMA10"].iloc[index-1] and
+            row["Volume"] > data["Volume"].iloc[index-1]):
+            signals.append("📉 EMA賣出")
+        if (index > 0 and row["High"] > data["High"].iloc[index-1] and
+            row["Low"] > data["Low"].iloc[index-1] and
+            row["Close"] > data["Close"].iloc[index-1]):
+            signals.append("📈 價格趨勢買入")
+        if (index > 0 and row["High"] < data["High"].iloc[index-1] and
+            row["Low"] < data["Low"].iloc[index-1] and
+            row["Close"] < data["Close"].iloc[index-1]):
+            signals.append("📉 價格趨勢賣出")
+        if (index > 0 and row["High"] > data["High"].iloc[index-1] and
+            row["Low"] > data["Low"].iloc[index-1] and
+            row["Close"] > data["Close"].iloc[index-1] and
+            row["Volume"] > data["前5均量"].iloc[index]):
+            signals.append("📈 價格趨勢買入(量)")
+        if (index > 0 and row["High"] < data["High"].iloc[index-1] and
+            row["Low"] < data["Low"].iloc[index-1] and
+            row["Close"] < data["Close"].iloc[index-1] and
+            row["Volume"] > data["前5均量"].iloc[index]):
+            signals.append("📉 價格趨勢賣出(量)")
+        if (index > 0 and row["High"] > data["High"].iloc[index-1] and
+            row["Low"] > data["Low"].iloc[index-1] and
+            row["Close"] > data["Close"].iloc[index-1] and
+            row["Volume Change %"] > 15):
+            signals.append("📈 價格趨勢買入(量%)")
+        if (index > 0 and row["High"] < data["High"].iloc[index-1] and
+            row["Low"] < data["Low"].iloc[index-1] and
+            row["Close"] < data["Close"].iloc[index-1] and
+            row["Volume Change %"] > 15):
+            signals.append("📉 價格趨勢賣出(量%)")
+        return ", ".join(signals) if signals else ""
+    return [mark_signal(row, i) for i, row in data.iterrows()]
+
+def bench_signals(rows=2_000, repeat=5):
+    data = add_indicators(make_bars(rows).reset_index())
+    # 门槛调低，让量价标记也会出现
+    price_threshold, volume_threshold = 50.0, 50.0
+
+    start = time.perf_counter()
+    legacy = legacy_mark_signals(data, price_threshold, volume_threshold)
+    legacy_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        flags = compute_signals(data, price_threshold, volume_threshold)
+        marks = mark_signals(flags)
+        latest_signals(flags)
+    vector_elapsed = (time.perf_counter() - start) / repeat
+
+    assert list(marks) == legacy, "向量化结果与逐列版本不一致"
+    print(f"signals  rows={rows}")
+    print(f"  iterrows   : {rows / legacy_elapsed:>14,.0f} rows/s  ({legacy_elapsed * 1000:.1f} ms)")
+    print(f"  vectorized : {rows / vector_elapsed:>14,.0f} rows/s  ({vector_elapsed * 1000:.1f} ms)")
+    print(f"  speedup    : {legacy_elapsed / vector_elapsed:.0f}x")
+
+# 同类规则的参数变体（不同 EMA 组合与成交量门槛），用来观察规则数增加时的成本
+def rule_variants(count):
+    variants = []
+    for i in range(count):
+        base = RULES[5 + i % 8]
+        params = dict(base.params)
+        if "fast" in params:
+            params.update(fast=params["fast"] + i % 3, slow=params["slow"] + i % 4)
+        if "volume_pct" in params:
+            params["volume_pct"] = params["volume_pct"] + i
+        variants.append(Rule(f"{base.key}_{i}", base.name, base.label, base.alert, base.email, base.evaluate, params))
+    return variants
+
+def bench_rules(rows=50_000, extra=(0, 13, 39, 87), repeat=5):
+    data = add_indicators(make_bars(rows).reset_index())
+    config = with_thresholds(None, 50.0, 50.0)
+    print(f"rules  rows={rows}")
+    for count in extra:
+        rules = RULES + rule_variants(count)
+        timings = {}
+        # 每条规则各自计算中间结果 vs 共用 FrameContext
+        for label, shared in (("isolated", False), ("shared", True)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                if shared:
+                    evaluate_rules(FrameContext(data), config, rules)
+                else:
+                    for rule in rules:
+                        evaluate_rules(FrameContext(data), config, [rule])
+            timings[label] = (time.perf_counter() - start) / repeat
+        print(f"  {len(rules):3d} rules : isolated {timings['isolated'] * 1000:7.1f} ms, "
+              f"shared {timings['shared'] * 1000:7.1f} ms ({timings['shared'] / len(rules) * 1e6:6.0f} µs/rule)")
+
+def bench_fetch(tickers=40, latency=0.05):
+    watchlist = [f"T{i:03d}" for i in range(tickers)]
+    print(f"fetch  tickers={tickers} latency={latency * 1000:.0f}ms/request")
+
+    # 旧版：逐档依序 history
+    provider = FakeProvider(latency=latency, batched=False)
+    start = time.perf_counter()
+    for ticker in watchlist:
+        provider.history(ticker, "5d", "1m")
+    elapsed = time.perf_counter() - start
+    print(f"  sequential  : {elapsed * 1000:8.1f} ms  calls={provider.calls} max_concurrency={provider.max_concurrency}")
+
+    for label, provider in (("batched", FakeProvider(latency=latency)),
+                            ("thread pool", FakeProvider(latency=latency, batched=False))):
+        start = time.perf_counter()
+        frames, errors = fetch_watchlist(watchlist, "5d", "1m", provider=provider)
+        elapsed = time.perf_counter() - start
+        assert len(frames) == tickers and not errors
+        print(f"  {label:<12}: {elapsed * 1000:8.1f} ms  calls={provider.calls} max_concurrency={provider.max_concurrency}")
+
+# 增量接续与整段重算的指标必须逐位相同；收盘价含缺值（包括正好落在接续点前），
+# 新 K 线笔数涵盖逐笔递推与超过 SMALL_UPDATE 时改用 pandas 的两种路径
+class SteppedProvider:
+    def __init__(self, bars, rows):
+        self.bars = bars
+        self.rows = rows
+
+    def download(self, tickers, period, interval, start=None):
+        return {t: self.history(t, period, interval, start) for t in tickers}
+
+    def history(self, ticker, period, interval, start=None):
+        bars = self.bars.iloc[:self.rows]
+        return bars if start is None else bars[bars.index >= start]
+
+def check_incremental(rows=600, steps=(1, 1, 3, 1, 70, 2, 1, 100)):
+    bars = make_bars(rows + sum(steps), seed=7)
+    gaps = [40, 41, 42, rows - 1, rows, rows + 5, rows + 6, rows + 80]
+    bars.iloc[gaps, bars.columns.get_loc("Close")] = float("nan")
+    provider = SteppedProvider(bars, rows)
+    store = BarStore(retention={})
+    store.refresh(["T"], "max", "1m", provider=provider)
+    for step in steps:
+        provider.rows += step
+        frames, _ = store.refresh(["T"], "max", "1m", provider=provider)
+        expected = add_indicators(bars.iloc[:provider.rows].reset_index())
+        for column in INDICATOR_COLUMNS:
+            assert np.array_equal(frames["T"][column].to_numpy(), expected[column].to_numpy(), equal_nan=True), column
+    print(f"  incremental == full recompute for {len(steps)} updates (NaN closes, +1 to +{max(steps)} bars)")
+
+def bench_cache(tickers=20, rows=50_000, refreshes=5):
+    watchlist = [f"T{i:03d}" for i in range(tickers)]
+    print(f"cache  tickers={tickers} history={rows} bars, +1 bar per refresh")
+    check_incremental()
+
+    # 旧版：每次刷新重抓整段历史并从头计算指标
+    provider = FakeProvider(rows=rows)
+    start = time.perf_counter()
+    for _ in range(refreshes):
+        provider.rows += 1
+        frames, _ = fetch_watchlist(watchlist, "max", "1m", provider=provider)
+        for data in frames.values():
+            add_indicators(data)
+    elapsed = (time.perf_counter() - start) / refreshes
+    print(f"  full recompute : {elapsed * 1000:8.1f} ms/refresh")
+
+    provider = FakeProvider(rows=rows)
+    store = BarStore(retention={})
+    store.refresh(watchlist, "max", "1m", provider=provider)
+    start = time.perf_counter()
+    for _ in range(refreshes):
+        provider.rows += 1
+        store.refresh(watchlist, "max", "1m", provider=provider)
+    elapsed = (time.perf_counter() - start) / refreshes
+    # 指标只重算新 K 线，但合并仍复制整段历史，这部分随 history 增长
+    print(f"  incremental    : {elapsed * 1000:8.1f} ms/refresh  (indicators O(new bars), history concat O(bars))")
+
+def bench_pipeline(tickers=20, latency=0.2, hung=3.0, ticker_timeout=1.0):
+    watchlist = [f"T{i:03d}" for i in range(tickers)]
+    slow = {watchlist[0]: hung}
+    print(f"pipeline  tickers={tickers} latency={latency * 1000:.0f}ms, {watchlist[0]} hangs {hung:g}s")
+
+    # 旧版：依序处理，第一档卡住就拖住所有后续代号
+    provider = FakeProvider(latency=latency, batched=False, slow=slow)
+    start = time.perf_counter()
+    first = None
+    for ticker in watchlist:
+        provider.history(ticker, "5d", "1m")
+        first = first or time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+    print(f"  sequential : first ticker {first:6.2f} s, refresh {elapsed:6.2f} s")
+
+    provider = FakeProvider(latency=latency, batched=False, slow=slow)
+    store = BarStore()
+    def load(ticker):
+        return store.refresh([ticker], "5d", "1m", provider=provider)
+    report = run_refresh(watchlist, load, lambda *args: None, ticker_timeout=ticker_timeout)
+    print(f"  async      : first ticker {report.first_ready:6.2f} s, refresh {report.elapsed:6.2f} s, "
+          f"timed out {report.timed_out}")
+
+# 模拟 SMTP：建立 TLS 连线并登录需 handshake 秒，每封信需 send 秒
+class FakeSMTP:
+    def __init__(self, handshake, send):
+        time.sleep(handshake)
+        self.send = send
+
+    def sendmail(self, sender, recipient, message):
+        time.sleep(self.send)
+
+    def quit(self):
+        pass
+
+def bench_alerts(tickers=10, cycles=3, handshake=0.3, send=0.02):
+    signals = ["macd_buy"]
+    print(f"alerts  {tickers} alerts/refresh x {cycles} refreshes, handshake={handshake * 1000:.0f}ms send={send * 1000:.0f}ms")
+
+    # 旧版：每则提醒各开一条连线，同步阻塞绘制
+    start = time.perf_counter()
+    for _ in range(cycles):
+        for _ in range(tickers):
+            FakeSMTP(handshake, send).sendmail(None, None, None)
+    elapsed = time.perf_counter() - start
+    print(f"  per-alert SMTP : blocked {elapsed * 1000:8.1f} ms, {tickers * cycles} emails")
+
+    dispatcher = AlertDispatcher(connect=lambda: FakeSMTP(handshake, send)).start()
+    start = time.perf_counter()
+    for cycle in range(cycles):
+        for i in range(tickers):
+            # 同一根 K 线在下一轮仍触发时应被去重
+            dispatcher.submit(f"T{i:03d}", 1.0, 1.0, signals, bar_time=cycle // 2)
+        dispatcher.flush()
+    blocked = time.perf_counter() - start
+    dispatcher.close()
+    metrics = dispatcher.metrics()
+    print(f"  dispatcher     : blocked {blocked * 1000:8.1f} ms, {metrics['sent']} digests, "
+          f"{metrics['connections']} connection(s), {metrics['suppressed']} duplicates suppressed, "
+          f"p95 send {metrics['p95_latency'] * 1000:.0f} ms")
+
+def bench_backtest(tickers=100, years=10, target=500):
+    rows = years * 252
+    print(f"backtest  {tickers} tickers x {rows} daily bars (parquet)")
+    with tempfile.TemporaryDirectory() as data_dir:
+        for i in range(tickers):
+            make_bars(rows, seed=i, start="2015-01-02", freq="B").reset_index().to_parquet(
+                os.path.join(data_dir, f"T{i:03d}_max_1d.parquet"), index=False)
+        paths = find_bar_files([data_dir])
+        for label, workers in (("1 process", 1), ("process pool", None)):
+            start = time.perf_counter()
+            stats, errors = run_backtest(paths, workers=workers)
+            elapsed = time.perf_counter() - start
+            assert len(stats) == tickers and not errors
+            print(f"  {label:<12}: {elapsed:6.2f} s  ({tickers * rows / elapsed:,.0f} bars/s, "
+                  f"~{elapsed / tickers * target:.1f} s for {target} tickers)")
+        summarize(stats)
+
+def bench_charts(tickers=50, rows=5_000):
+    frames = {f"T{i:03d}": add_indicators(make_bars(rows, seed=i).reset_index()) for i in range(tickers)}
+    print(f"charts  {tickers} tickers x {rows} bars, build + the to_json st.plotly_chart runs on every rerun")
+
+    # payload 即 st.plotly_chart 每轮序列化后送出的字节数，缓存的图表也同样要序列化
+    def measure(label, build):
+        start = time.perf_counter()
+        payload = sum(payload_size(build(ticker, data)) for ticker, data in frames.items())
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<22}: {elapsed * 1000:8.1f} ms, payload {payload / 1024:8.0f} KB")
+
+    measure("svg px.line (last 50)", lambda ticker, data: svg_figure(data, ticker))
+    measure("webgl LTTB (full)", lambda ticker, data: webgl_figure(data, ticker))
+    cache = ChartCache()
+    for ticker, data in frames.items():
+        cache.figure(ticker, data, ticker)
+    measure("webgl cached (no bar)", lambda ticker, data: cache.figure(ticker, data, ticker))
+
+    results = [{"ticker": ticker, "data": data, "current_price": data["Close"].iloc[-1],
+                "price_pct_change": 0.0, "signals": []} for ticker, data in frames.items()]
+    start = time.perf_counter()
+    table = sparkline_table(results)
+    elapsed = time.perf_counter() - start
+    print(f"  sparkline grid        : {elapsed * 1000:8.1f} ms, payload {len(table.to_json()) / 1024:8.0f} KB")
+
+def bench_export(tickers=20, rows=20_000):
+    import pyarrow as pa
+    frames = {f"T{i:03d}": add_indicators(make_bars(rows, seed=i).reset_index()) for i in range(tickers)}
+    print(f"export  {tickers} tickers x {rows} bars")
+
+    # 旧版：每次刷新为每档的下载按钮先生成整份 CSV 字串
+    start = time.perf_counter()
+    buffers = [data.to_csv(index=False) for data in frames.values()]
+    elapsed = time.perf_counter() - start
+    print(f"  eager to_csv per refresh : {elapsed * 1000:8.1f} ms, {sum(map(len, buffers)) / 2**20:7.1f} MB of strings held")
+    del buffers
+    start = time.perf_counter()
+    [partial(data.to_csv, index=False) for data in frames.values()]
+    elapsed = time.perf_counter() - start
+    print(f"  lazy buttons per refresh : {elapsed * 1000:8.1f} ms, nothing held until clicked")
+
+    # 点击“下载全部代号”时的成本；Arrow 内存池峰值约为单一代号的大小。
+    # 结果经过 download_button 使用的同一转换，确认 Streamlit 接受这个类型
+    from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+    for fmt in EXPORT_FORMATS:
+        pool = pa.default_memory_pool()
+        baseline = pool.bytes_allocated()
+        start = time.perf_counter()
+        data, _ = convert_data_to_bytes_and_infer_mime(export_watchlist(lambda: frames, fmt),
+                                                       TypeError(f"{fmt}: unsupported download data type"))
+        elapsed = time.perf_counter() - start
+        size = len(data)
+        del data
+        print(f"  combined {fmt:<8}        : {elapsed * 1000:8.1f} ms, {size / 2**20:7.1f} MB file, "
+              f"arrow peak {(pool.max_memory() - baseline) / 2**20:6.1f} MB")
+
+def bench_instruments(calls=200_000):
+    print(f"instruments  {calls} stage() calls")
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    bare = time.perf_counter() - start
+    for label, enabled in (("disabled", False), ("enabled", True)):
+        instruments = Instrumentation(enabled=enabled)
+        start = time.perf_counter()
+        for _ in range(calls):
+            with instruments.stage("fetch", "TSLA"):
+                pass
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<9}: {(elapsed - bare) / calls * 1e9:8.0f} ns/stage overhead")
+
+def bench_screener(tickers=2_000, rows=390, lagging=20):
+    universe = [f"U{i:04d}" for i in range(tickers)]
+    provider = FakeProvider(rows=rows)
+    print(f"screener  {tickers} symbols x {rows} bars")
+
+    screener = Screener()
+    start = time.perf_counter()
+    screener.refresh(universe, "5d", "1m", provider=provider)
+    print(f"  initial refresh   : {time.perf_counter() - start:8.2f} s")
+    # 部分代号连续几轮抓取失败，落后超过 TAIL_ROWS 笔后再一起接续
+    provider.fail = set(universe[:lagging])
+    provider.rows += 8
+    screener.refresh(universe, "5d", "1m", provider=provider)
+    provider.fail = set()
+    provider.rows += 1
+    start = time.perf_counter()
+    screener.refresh(universe, "5d", "1m", provider=provider)
+    print(f"  +1 bar refresh    : {time.perf_counter() - start:8.2f} s  ({lagging} symbols catching up 9 bars)")
+    provider.rows += 1
+    start = time.perf_counter()
+    screener.refresh(universe, "5d", "1m", provider=provider)
+    print(f"  +1 bar refresh    : {time.perf_counter() - start:8.2f} s")
+
+    # 常驻内存：另建一个筛选器与数据源，刷新后丢弃数据源，剩下的只有筛选器保留的配置
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    retained, source = Screener(), FakeProvider(rows=provider.rows)
+    retained.refresh(universe, "5d", "1m", provider=source)
+    del source
+    gc.collect()
+    resident = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del retained
+
+    # 旧版做法：每档保留完整 K 线，逐档 compute_signals 后取最后一列
+    frames, _ = fetch_watchlist(universe, "5d", "1m", provider=provider)
+    frames = {ticker: add_indicators(data, screener.state.spans) for ticker, data in frames.items()}
+    start = time.perf_counter()
+    expected = {ticker: int(compute_signals(data, 80.0, 80.0).iloc[-1].sum()) for ticker, data in frames.items()}
+    elapsed = time.perf_counter() - start
+    full_bytes = sum(data.memory_usage(deep=True).sum() for data in frames.values())
+    print(f"  per-ticker frames : {elapsed * 1000:8.1f} ms/scan, {full_bytes / tickers:8,.0f} bytes/symbol")
+
+    start = time.perf_counter()
+    hits = screener.scan(universe, 80.0, 80.0)
+    elapsed = time.perf_counter() - start
+    print(f"  state index scan  : {elapsed * 1000:8.1f} ms/scan, {screener.state.bytes_per_symbol} bytes/symbol arrays, "
+          f"{resident / tickers:,.0f} bytes/symbol resident (tracemalloc), {len(hits)} hits")
+    # 向量化递推的状态应与完整历史最后两列逐位相同，信号也相同
+    state = screener.state
+    for ticker, data in frames.items():
+        row = state.index[ticker]
+        for name, i in state.positions.items():
+            values = data[name].to_numpy(dtype=float)
+            assert np.array_equal(state.current[row, i], values[-1], equal_nan=True), (ticker, name)
+            assert np.array_equal(state.previous[row, i], values[-2], equal_nan=True), (ticker, name)
+    counts = dict(zip(hits["代號"], hits["訊號數"]))
+    assert all(counts.get(ticker, 0) == count for ticker, count in expected.items())
+
+# 页面第一次执行时载入的本地模块（与 v2.py 相同），以及改为用到时才载入的重型模块
+APP_IMPORTS = "streamlit, alerts, bar_cache, charts, exports, fetcher, instrumentation, pipeline, screener, signals, snapshot_store"
+LAZY_IMPORTS = "yfinance, plotly.express, pyarrow.parquet, smtplib, email.mime.multipart"
+# streamlit 本身在载入时就引入 plotly.graph_objects（st.plotly_chart 用），页面无法延后，不计入本程序的延迟载入
+STREAMLIT_IMPORTS = "plotly.graph_objects"
+STARTUP_TARGET_MS = 1_500
+INTERACTION_TARGET_MS = 100
+
+def _verdict(value, target):
+    return "ok" if value <= target else "MISS"
+
+def bench_startup(tickers=20, rows=5_000, latency=0.2, ttl=60, repeat=3):
+    print(f"startup  cold imports; interaction rerun with {tickers} tickers x {rows} bars, {latency * 1000:.0f} ms per fetch")
+    # 每次在新进程中测量，才不会沿用本进程已载入的模块
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            f"import {APP_IMPORTS}\n"
+            f"loaded = [m for m in '{LAZY_IMPORTS}, {STREAMLIT_IMPORTS}'.split(', ') if m in sys.modules]\n"
+            "middle = time.perf_counter()\n"
+            f"import {LAZY_IMPORTS}\n"
+            "print(middle - start, time.perf_counter() - middle, ','.join(loaded))\n")
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        samples.append((float(output[0]) * 1000, float(output[1]) * 1000, output[2] if len(output) > 2 else ""))
+    startup, deferred, loaded = min(samples)
+    loaded = loaded.split(",") if loaded else []
+    eager = [m for m in loaded if m not in STREAMLIT_IMPORTS.split(", ")]
+    by_streamlit = [m for m in loaded if m in STREAMLIT_IMPORTS.split(", ")]
+    print(f"  cold imports       : {startup:8.0f} ms  target <= {STARTUP_TARGET_MS} ms {_verdict(startup, STARTUP_TARGET_MS)}, "
+          f"eagerly loaded heavy modules: {', '.join(eager) or 'none'}"
+          f"{' (lazy import broken)' if eager else ''}; loaded by streamlit itself: {', '.join(by_streamlit) or 'none'}")
+    print(f"  deferred to use    : {deferred:8.0f} ms  (yfinance / plotly.express / pyarrow / smtplib, "
+          f"paid on first fetch, chart, export or email)")
+
+    # 调整阈值触发的重新执行：旧版每次都向数据源增量抓取，现在 TTL 内直接用缓存的 K 线与指标只重算信号
+    watchlist = [f"T{i:03d}" for i in range(tickers)]
+    provider = FakeProvider(rows=rows, latency=latency, batched=False)
+    store = BarStore()
+
+    def rerun(price_threshold, max_age):
+        calls = provider.calls
+        start = time.perf_counter()
+        frames, _ = store.refresh(watchlist, "5d", "1m", provider=provider, max_age=max_age)
+        for ticker, data in frames.items():
+            analyze_ticker(ticker, data, data["Close"].iloc[-2], price_threshold, 80.0)
+        return (time.perf_counter() - start) * 1000, provider.calls - calls
+
+    elapsed, calls = rerun(80.0, ttl)
+    print(f"  first load         : {elapsed:8.1f} ms, {calls} fetches")
+    elapsed, calls = rerun(50.0, None)
+    print(f"  rerun, no TTL      : {elapsed:8.1f} ms, {calls} fetches")
+    elapsed, calls = min(rerun(threshold, ttl) for threshold in (40.0, 60.0, 90.0))
+    print(f"  rerun within TTL   : {elapsed:8.1f} ms, {calls} fetches  "
+          f"target <= {INTERACTION_TARGET_MS} ms {_verdict(elapsed, INTERACTION_TARGET_MS)}")
+
+BENCHES = {
+    "signals": bench_signals,
+    "rules": bench_rules,
+    "fetch": bench_fetch,
+    "cache": bench_cache,
+    "pipeline": bench_pipeline,
+    "alerts": bench_alerts,
+    "backtest": bench_backtest,
+    "charts": bench_charts,
+    "export": bench_export,
+    "instruments": bench_instruments,
+    "screener": bench_screener,
+    "startup": bench_startup,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHES)
+    for name in names:
+        BENCHES[name]()
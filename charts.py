@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+
+from signals import RULES_BY_KEY
+
+WEBGL_MODE = "WebGL（降採樣）"
+SVG_MODE = "SVG（原版）"
+GRID_MODE = "迷你走勢總覽"
+CHART_MODES = [WEBGL_MODE, SVG_MODE, GRID_MODE]
+
+# 每条曲线最多绘制的点数，超过时以 LTTB 降采样，图表大小不再随历史长度增长；
+# 250 点时整张图约 8.5 KB，小于只画最近 50 笔的 SVG 图（约 11 KB，多半是默认模板）
+POINT_BUDGET = 250
+SPARKLINE_POINTS = 60
+
+# Largest-Triangle-Three-Buckets：保留首尾两点，其余每个桶挑出与前一选点、下一桶均值
+# 构成三角形面积最大的点，峰谷等形状特征得以保留；返回选中的位置
+def lttb(x, y, budget):
+    n = len(y)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+    # 各桶的均值一次算好；最后一个桶的"下一桶"是终点本身
+    sizes = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes, y[-1])
+    selected = np.empty(budget, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(budget - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y[i + 1] - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+# 时间轴以当地时间的毫秒数传送（配合 xaxis type="date"）；Plotly 会把 int64 写成 JSON 数字列表，
+# float64 则以 base64 二进位传送（每点约 11 字元，列表约 15 字元），毫秒数在 float64 中仍是精确的
+def _epoch_ms(times):
+    if times.dt.tz is not None:
+        times = times.dt.tz_localize(None)
+    return times.to_numpy(dtype="datetime64[ms]").astype("int64").astype("float64")
+
+# 数值以 float32 传送，base64 长度减半；价格与成交量的显示不需要更高精度
+def _downsample(data, column, budget):
+    values = data[column].to_numpy(dtype=float)
+    times = _epoch_ms(data["Datetime"])
+    picked = lttb(times, np.nan_to_num(values), budget)
+    return times[picked], values[picked].astype("float32")
+
+# plotly.express 在第一次绘图时才载入：迷你走势总览、监控程序与回测都用不到它
+# （plotly.graph_objects 在页面中已由 streamlit 本身载入，延后只对监控程序与回测有效）
+# 原版图表：最近 50 笔，SVG 渲染
+def svg_figure(data, ticker):
+    import plotly.express as px
+    fig = px.line(data.tail(50), x="Datetime", y=["Close", "Volume"],
+                  title=f"{ticker} 價格與成交量",
+                  labels={"Close": "價格", "Volume": "成交量"},
+                  render_mode="svg")
+    fig.update_layout(yaxis2=dict(overlaying="y", side="right", title="成交量"))
+    return fig
+
+# 轻量图表：完整历史降采样到固定点数，以 WebGL 绘制；uirevision 让刷新后保留缩放位置
+def webgl_figure(data, ticker, budget=POINT_BUDGET):
+    import plotly.graph_objects as go
+    price_x, price_y = _downsample(data, "Close", budget)
+    volume_x, volume_y = _downsample(data, "Volume", budget)
+    return go.Figure(
+        [
+            go.Scattergl(x=price_x, y=price_y, mode="lines", name="價格"),
+            go.Scattergl(x=volume_x, y=volume_y, mode="lines", name="成交量", yaxis="y2"),
+        ],
+        layout=dict(title=f"{ticker} 價格與成交量", uirevision=ticker, xaxis=dict(type="date"),
+                    # Streamlit 会套用自己的主题，不必送出 Plotly 默认模板
+                    template="none",
+                    yaxis=dict(title="價格"), yaxis2=dict(overlaying="y", side="right", title="成交量")),
+    )
+
+# 图表序列化后的大小（字节），与 st.plotly_chart 每次执行时的序列化方式相同，即每轮送往浏览器的数据量
+def payload_size(fig):
+    import plotly.io
+    return len(plotly.io.to_json(fig, validate=False))
+
+# 依最后一根 K 线与图表模式缓存各代号的图表，没有新 K 线时直接沿用，不必重新降采样与建图；
+# payload 大小也只在图表改变时量一次。st.plotly_chart 每轮仍会自行序列化一次，这部分无法省去
+class ChartCache:
+    def __init__(self, budget=POINT_BUDGET):
+        self.budget = budget
+        self._figures = {}
+        self._payloads = {}
+
+    def figure(self, key, data, ticker, mode=WEBGL_MODE):
+        stamp = (len(data), data["Datetime"].iloc[-1], mode)
+        cached = self._figures.get(key)
+        if cached is None or cached[0] != stamp:
+            fig = svg_figure(data, ticker) if mode == SVG_MODE else webgl_figure(data, ticker, self.budget)
+            cached = self._figures[key] = (stamp, fig)
+            self._payloads.pop(key, None)
+        return cached[1]
+
+    def payload_size(self, key):
+        if key not in self._payloads:
+            self._payloads[key] = payload_size(self._figures[key][1])
+        return self._payloads[key]
+
+# 所有代号一张表：LineChartColumn 在浏览器端画迷你走势，不经过 Plotly
+def sparkline_table(results, points=SPARKLINE_POINTS):
+    rows = []
+    for result in results:
+        data = result["data"]
+        _, closes = _downsample(data, "Close", points)
+        rows.append({
+            "代號": result["ticker"],
+            "價格": result["current_price"],
+            "漲跌 %": result["price_pct_change"],
+            "走勢": np.round(closes.astype(float), 4).tolist(),
+            "異動": "、".join(RULES_BY_KEY[key].name for key in result["signals"]),
+        })
+    return pd.DataFrame(rows)
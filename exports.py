@@ -0,0 +1,60 @@
+import tempfile
+
+from instrumentation import instruments
+
+# 多代号汇出：{格式: (扩展名, MIME)}
+EXPORT_FORMATS = {
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Arrow": ("arrow", "application/vnd.apache.arrow.file"),
+    "CSV": ("csv", "text/csv"),
+}
+# 汇出内容超过此大小（字节）才写入磁盘暂存档
+SPOOL_SIZE = 16 * 1024 * 1024
+
+# pyarrow 在第一次汇出时才载入，页面启动不必付出它的载入时间
+# 转成 Arrow 表并加上代号列；时间统一为 UTC，不同交易所的代号才能写入同一个 schema
+def _ticker_table(ticker, data, schema=None):
+    import pyarrow as pa
+    data = data.drop(columns=[c for c in data.columns if c.startswith("Unnamed")])
+    if "Datetime" in data.columns and data["Datetime"].dt.tz is not None:
+        data = data.assign(Datetime=data["Datetime"].dt.tz_convert("UTC"))
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    table = table.add_column(0, "Ticker", pa.array([ticker] * len(table), pa.string()))
+    return table if schema is None else table.select(schema.names).cast(schema)
+
+def _writer(fmt, sink, schema):
+    if fmt == "Parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    if fmt == "Arrow":
+        import pyarrow.ipc as ipc
+        return ipc.new_file(sink, schema)
+    import pyarrow.csv as pa_csv
+    return pa_csv.CSVWriter(sink, schema)
+
+# 逐档写入：每次只转换一个代号，Parquet 每档一个 row group，
+# 内存峰值约为单一代号的大小，不随代号数增长；frames 为 {代号: K 线}
+def write_watchlist(frames, fmt, sink):
+    writer = schema = None
+    try:
+        for ticker, data in frames.items():
+            if data is None or data.empty:
+                continue
+            table = _ticker_table(ticker, data, schema)
+            if writer is None:
+                schema = table.schema
+                writer = _writer(fmt, sink, schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return writer is not None
+
+# download_button 的延迟汇出：点击时才读取 frames 并生成文件；
+# Streamlit 只接受 bytes/str/BytesIO/BufferedReader，且会整份读入内存，这里直接返回 bytes
+def export_watchlist(load_frames, fmt):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as sink:
+        with instruments.stage("export"):
+            write_watchlist(load_frames(), fmt, sink)
+        sink.seek(0)
+        return sink.read()
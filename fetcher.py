@@ -0,0 +1,191 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# 日线以下的间隔：可从同一批 K 线中找到前一交易日收盘价
+INTRADAY_INTERVALS = {"1m", "2m", "5m", "15m", "30m", "60m", "90m", "1h"}
+MAX_WORKERS = 8
+
+# 给定 start 时只抓该时间点之后（含）的 K 线，否则抓整个 period
+def _range(period, start):
+    return {"start": start} if start is not None else {"period": period}
+
+# yf.download 把结果放在模块级的共用字典，每次调用先清空再等待其填满，
+# 多个线程同时调用会清掉或读到彼此的结果；同一进程内的批量下载因此逐一进行
+_DOWNLOAD_LOCK = threading.Lock()
+
+# 前一交易日收盘价当天不会变，查询结果缓存此时间（秒）
+PREVIOUS_CLOSE_TTL = 3600
+
+# Yahoo Finance 数据源：一次批量下载整个自选清单，失败时逐档抓取；
+# yfinance 载入较慢，第一次抓取时才 import，快照模式与回测不会载入
+class YFinanceProvider:
+    def __init__(self, previous_close_ttl=PREVIOUS_CLOSE_TTL):
+        self.previous_close_ttl = previous_close_ttl
+        self._previous_close = {}
+        self._lock = threading.Lock()
+
+    def download(self, tickers, period, interval, start=None):
+        import yfinance as yf
+        with _DOWNLOAD_LOCK:
+            raw = yf.download(tickers=list(tickers), interval=interval, **_range(period, start),
+                              group_by="ticker", auto_adjust=True, threads=True, progress=False)
+        frames = {}
+        for ticker in tickers:
+            if isinstance(raw.columns, pd.MultiIndex):
+                frame = raw[ticker] if ticker in raw.columns.get_level_values(0) else pd.DataFrame()
+            else:
+                frame = raw
+            frames[ticker] = frame
+        return frames
+
+    # 单一代号：Ticker 物件各自保存结果，可以在多个线程中同时调用
+    def history(self, ticker, period, interval, start=None):
+        import yfinance as yf
+        return yf.Ticker(ticker).history(interval=interval, **_range(period, start))
+
+    def previous_close(self, ticker):
+        with self._lock:
+            cached = self._previous_close.get(ticker)
+        if cached is not None and time.monotonic() - cached[0] < self.previous_close_ttl:
+            return cached[1]
+        import yfinance as yf
+        # fast_info 只读一次报价，比 stock.info 轻量许多
+        value = yf.Ticker(ticker).fast_info.get("previousClose")
+        with self._lock:
+            self._previous_close[ticker] = (time.monotonic(), value)
+        return value
+
+# 生成随机游走的 K 线数据，供离线测试与基准使用
+def make_bars(rows, seed=0, start="2024-01-02 09:30", freq="min"):
+    # 按列抽样，rows 增加时前面的 K 线保持不变，便于模拟逐笔新增
+    noise = np.random.default_rng(seed).normal(size=(rows, 3))
+    close = 100 * np.exp(np.cumsum(noise[:, 0] * 0.002))
+    spread = np.abs(noise[:, 1] * 0.001) * close
+    index = pd.date_range(start, periods=rows, freq=freq, tz="America/New_York", name="Datetime")
+    return pd.DataFrame({
+        "Open": close + noise[:, 2] * 0.0005 * close,
+        "High": close + spread,
+        "Low": close - spread,
+        "Close": close,
+        "Volume": np.random.default_rng(seed + 1).integers(1_000, 100_000, rows),
+    }, index=index)
+
+# 离线数据源：模拟网络延迟，并记录调用次数与最大并发数
+class FakeProvider:
+    def __init__(self, rows=390, latency=0.0, batched=True, fail=(), slow=None):
+        self.rows = rows
+        self.latency = latency
+        # {代号: 延迟秒数}，模拟个别代号回应缓慢或卡住
+        self.slow = dict(slow or {})
+        self.batched = batched
+        self.fail = set(fail)
+        self.calls = 0
+        self.active = 0
+        self.max_concurrency = 0
+        self._generated = {}
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_concurrency = max(self.max_concurrency, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def _bars(self, ticker, start=None):
+        if ticker in self.fail:
+            raise RuntimeError(f"{ticker} 模拟下载失败")
+        bars = self._generated.get(ticker)
+        if bars is None or len(bars) < self.rows:
+            # 预留余量，调大 rows 模拟新 K 线时不必重新生成
+            bars = self._generated[ticker] = make_bars(self.rows + 1_000, seed=sum(map(ord, ticker)))
+        bars = bars.iloc[:self.rows]
+        return bars if start is None else bars.iloc[bars.index.searchsorted(start):]
+
+    def download(self, tickers, period, interval, start=None):
+        if not self.batched:
+            raise NotImplementedError("此数据源不支持批量下载")
+        self._enter()
+        try:
+            time.sleep(max([self.latency] + [self.slow.get(t, 0) for t in tickers]))
+            return {t: (pd.DataFrame() if t in self.fail else self._bars(t, start)) for t in tickers}
+        finally:
+            self._exit()
+
+    def history(self, ticker, period, interval, start=None):
+        self._enter()
+        try:
+            time.sleep(self.slow.get(ticker, self.latency))
+            return self._bars(ticker, start)
+        finally:
+            self._exit()
+
+    def previous_close(self, ticker):
+        return None
+
+# 统一时间列名称为 "Datetime"，并去掉批量下载时为对齐而补上的空列
+def normalize_frame(frame):
+    if frame is None or frame.empty:
+        return pd.DataFrame()
+    data = frame.dropna(how="all", subset=[c for c in ("Open", "High", "Low", "Close") if c in frame.columns])
+    data = data.reset_index()
+    if "Date" in data.columns:
+        data = data.rename(columns={"Date": "Datetime"})
+    return data
+
+# 抓取整个自选清单，返回 ({代号: K 线}, {代号: 错误})；convert 把数据源的原始表转成调用方要的格式
+def fetch_watchlist(tickers, period, interval, provider=None, max_workers=MAX_WORKERS, start=None,
+                    convert=normalize_frame):
+    provider = provider or YFinanceProvider()
+    tickers = list(dict.fromkeys(tickers))
+    frames, errors = {}, {}
+    if not tickers:
+        return frames, errors
+
+    # 只有一档时（页面以多个线程各刷新一档）直接逐档抓取，不经过批量下载的共用状态
+    if len(tickers) > 1:
+        try:
+            raw = provider.download(tickers, period, interval, start=start)
+            return {t: convert(raw.get(t)) for t in tickers}, errors
+        except Exception:
+            pass
+
+    # 批量下载失败时，改用有上限的线程池逐档抓取
+    def fetch_one(ticker):
+        return convert(provider.history(ticker, period, interval, start=start))
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tickers))) as pool:
+        futures = {t: pool.submit(fetch_one, t) for t in tickers}
+        for ticker, future in futures.items():
+            try:
+                frames[ticker] = future.result()
+            except Exception as e:
+                frames[ticker] = convert(None)
+                errors[ticker] = e
+    return frames, errors
+
+# 从已有 K 线推算前一交易日收盘价，无法推算时返回 None
+def previous_close_from_bars(data, interval):
+    if interval not in INTRADAY_INTERVALS and interval != "1d":
+        return None
+    if len(data) < 2:
+        return None
+    dates = data["Datetime"].dt.date
+    earlier = data["Close"][dates < dates.iloc[-1]]
+    return float(earlier.iloc[-1]) if len(earlier) else None
+
+def resolve_previous_close(ticker, data, interval, provider=None):
+    previous_close = previous_close_from_bars(data, interval)
+    if previous_close is None and provider is not None:
+        try:
+            previous_close = provider.previous_close(ticker)
+        except Exception:
+            previous_close = None
+    return previous_close if previous_close is not None else data["Close"].iloc[-1]
@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 滚动窗口长度：前 5 笔均价与均量
+ROLLING_WINDOW = 5
+# 新 K 线不超过此数时直接逐笔递推 EMA，省去 pandas 的固定开销
+SMALL_UPDATE = 64
+
+INDICATOR_COLUMNS = [
+    "Price Change %", "Volume Change %", "Close_Difference",
+    "前5均價", "前5均價ABS", "前5均量", "📈 股價漲跌幅 (%)", "📊 成交量變動幅 (%)",
+    "EMA12", "EMA26", "MACD", "Signal", "EMA5", "EMA10",
+]
+
+# adjust=False 的 EMA；给定 seed（前一笔的 EMA 值）时从该状态接续计算。
+# 与 pandas 相同：遇到 NaN 时沿用前值，但旧值的权重逐笔衰减，缺值后的第一笔因此更偏向新值；
+# gap 为接续点之前已连续缺值的笔数
+def ema(values, span, seed=None, gap=0):
+    if seed is None or np.isnan(seed):
+        return pd.Series(values).ewm(span=span, adjust=False).mean().to_numpy()
+    # 与 pandas 由 span 换算 alpha 的方式相同，结果逐位一致
+    alpha = 1 / (1 + (span - 1) / 2)
+    if len(values) <= SMALL_UPDATE:
+        result = np.empty(len(values))
+        weighted, old_weight = seed, (1 - alpha) ** gap
+        for i, value in enumerate(values):
+            old_weight *= 1 - alpha
+            if not np.isnan(value):
+                if weighted != value:
+                    weighted = (old_weight * weighted + alpha * value) / (old_weight + alpha)
+                old_weight = 1.0
+            result[i] = weighted
+        return result
+    seeded = np.concatenate([[seed], np.full(gap, np.nan), values])
+    return pd.Series(seeded).ewm(span=span, adjust=False).mean().to_numpy()[1 + gap:]
+
+# values 末端连续 NaN 的笔数
+def trailing_nans(values):
+    observed = np.flatnonzero(~np.isnan(values))
+    return len(values) - 1 - observed[-1] if len(observed) else len(values)
+
+def _pct_change(values):
+    result = np.full(len(values), np.nan)
+    result[1:] = values[1:] / values[:-1] - 1
+    return result
+
+def _rolling_mean(values, window):
+    result = np.full(len(values), np.nan)
+    if len(values) >= window:
+        result[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return result
+
+# 计算涨跌幅、前 5 笔均值、MACD 与 EMA 等指标列；ema_spans 另外加算 EMA{span} 列（如规则改用 EMA8）
+def add_indicators(data, ema_spans=()):
+    return update_indicators(data, 0, ema_spans)
+
+# 只重算第 start 笔之后的指标：EMA/MACD 由第 start-1 笔的值接续，
+# 涨跌幅与滚动均值只需往前多取 ROLLING_WINDOW 笔，因此成本为 O(新 K 线数)
+def update_indicators(data, start, ema_spans=()):
+    start = max(0, min(start, len(data)))
+    context = max(0, start - ROLLING_WINDOW)
+    close = data["Close"].to_numpy(dtype=float)[context:]
+    volume = data["Volume"].to_numpy(dtype=float)[context:]
+
+    def seed(column):
+        return float(data[column].iloc[start - 1]) if start > 0 and column in data.columns else None
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # 计算涨跌幅百分比
+        price_change = np.round(_pct_change(close), 4) * 100
+        columns = {
+            "Price Change %": price_change,
+            "Volume Change %": np.round(_pct_change(volume), 4) * 100,
+            "Close_Difference": np.round(np.diff(close, prepend=np.nan), 2),
+        }
+
+        # 计算前 5 笔平均收盘价与平均成交量
+        columns["前5均價"] = _rolling_mean(price_change, ROLLING_WINDOW)
+        columns["前5均價ABS"] = _rolling_mean(np.abs(price_change), ROLLING_WINDOW)
+        columns["前5均量"] = _rolling_mean(volume, ROLLING_WINDOW)
+        columns["📈 股價漲跌幅 (%)"] = np.round((np.abs(price_change) - columns["前5均價ABS"]) / columns["前5均價ABS"], 4) * 100
+        columns["📊 成交量變動幅 (%)"] = np.round((volume - columns["前5均量"]) / columns["前5均量"], 4) * 100
+
+    # 计算 MACD 与 9 期 Signal（保留 EMA12/EMA26 作为下次接续的状态）
+    fresh = close[start - context:]
+    # 接续点前的收盘价缺值时 EMA 旧权重仍要衰减（只往前看 ROLLING_WINDOW 笔）
+    gap = trailing_nans(close[:start - context])
+    columns["EMA12"] = ema(fresh, 12, seed("EMA12"), gap)
+    columns["EMA26"] = ema(fresh, 26, seed("EMA26"), gap)
+    columns["MACD"] = columns["EMA12"] - columns["EMA26"]
+    columns["Signal"] = ema(columns["MACD"], 9, seed("Signal"))
+
+    # 计算 EMA5 和 EMA10
+    columns["EMA5"] = ema(fresh, 5, seed("EMA5"), gap)
+    columns["EMA10"] = ema(fresh, 10, seed("EMA10"), gap)
+    for span in ema_spans:
+        if f"EMA{span}" not in columns:
+            columns[f"EMA{span}"] = ema(fresh, span, seed(f"EMA{span}"), gap)
+
+    # 各列末端都对齐最后一笔，只替换第 start 笔之后的部分再接回前段
+    count = len(data) - start
+    names = INDICATOR_COLUMNS + [name for name in columns if name not in INDICATOR_COLUMNS]
+    base = data.iloc[start:].drop(columns=[c for c in names if c in data.columns]).reset_index(drop=True)
+    indicators = pd.DataFrame({name: columns[name][len(columns[name]) - count:] for name in names})
+    tail = pd.concat([base, indicators], axis=1)
+    if start == 0:
+        return tail
+    return pd.concat([data.iloc[:start], tail], ignore_index=True)
@@ -0,0 +1,188 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+
+# 各阶段计时：fetch、prev_close、indicators、signals、alerting、render、export、smtp、refresh
+# INSTRUMENTATION=0 时关闭，stage() 直接返回共用的空 context，几乎没有额外成本
+ENABLED = os.getenv("INSTRUMENTATION", "1") != "0"
+# 每个阶段保留最近多少笔耗时用于计算百分位数
+WINDOW = 500
+QUANTILES = (0.5, 0.95, 0.99)
+
+_NOOP = nullcontext()
+
+class _Timer:
+    __slots__ = ("owner", "name", "ticker", "started")
+
+    def __init__(self, owner, name, ticker):
+        self.owner = owner
+        self.name = name
+        self.ticker = ticker
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.owner.observe(self.name, time.perf_counter() - self.started, self.ticker)
+        return False
+
+# 进程内共用的计时与计数器；页面各工作线程、背景发信线程都会写入，以锁保护
+class Instrumentation:
+    def __init__(self, enabled=ENABLED, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._totals = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._tickers = defaultdict(dict)
+        self._counters = defaultdict(int)
+
+    def stage(self, name, ticker=None):
+        if not self.enabled:
+            return _NOOP
+        return _Timer(self, name, ticker)
+
+    # 记录在别处量得的耗时（秒），如 SMTP 发送或整轮刷新
+    def observe(self, name, seconds, ticker=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._samples[name].append(seconds)
+            self._totals[name] += seconds
+            self._counts[name] += 1
+            if ticker is not None:
+                self._tickers[ticker][name] = seconds
+
+    def count(self, name, value=1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] += value
+
+    # 包装函数，每次调用都计入指定阶段；关闭时原样返回
+    def wrap(self, name, func, ticker=None):
+        if not self.enabled:
+            return func
+        def timed(*args, **kwargs):
+            with self.stage(name, ticker):
+                return func(*args, **kwargs)
+        return timed
+
+    def reset(self):
+        with self._lock:
+            for store in (self._samples, self._totals, self._counts, self._tickers, self._counters):
+                store.clear()
+
+    # 各阶段最近 window 笔的百分位数（毫秒）与累计次数、耗时
+    def summary(self):
+        with self._lock:
+            samples = {name: np.asarray(values) for name, values in self._samples.items()}
+            totals, counts = dict(self._totals), dict(self._counts)
+        rows = []
+        for name, values in sorted(samples.items()):
+            p50, p95, p99 = np.quantile(values, QUANTILES) * 1000
+            rows.append({"階段": name, "次數": counts[name], "累計 (秒)": totals[name],
+                         "p50 (ms)": p50, "p95 (ms)": p95, "p99 (ms)": p99, "最大 (ms)": values.max() * 1000})
+        return pd.DataFrame(rows)
+
+    # 每个代号最近一次各阶段的耗时（毫秒）
+    def ticker_table(self):
+        with self._lock:
+            tickers = {ticker: dict(stages) for ticker, stages in self._tickers.items()}
+        table = pd.DataFrame.from_dict(tickers, orient="index") * 1000
+        return table.sort_index().rename_axis("代號")
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # Prometheus 文字格式：阶段耗时为 summary，计数器为 counter
+    def prometheus(self, prefix="v2"):
+        with self._lock:
+            samples = {name: np.asarray(values) for name, values in self._samples.items()}
+            totals, counts, counters = dict(self._totals), dict(self._counts), dict(self._counters)
+        lines = [f"# HELP {prefix}_stage_seconds Duration of each refresh stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name, values in sorted(samples.items()):
+            for q, value in zip(QUANTILES, np.quantile(values, QUANTILES)):
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q:g}"}} {value:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {totals[name]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {counts[name]}')
+        lines += [f"# HELP {prefix}_events_total Count of refresh events.",
+                  f"# TYPE {prefix}_events_total counter"]
+        for name, value in sorted(counters.items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+instruments = Instrumentation()
+
+# 效能剖析一轮刷新：cProfile 分别剖析主线程与每个工作线程的调用（wrap 过的函数）再合并；
+# 安装了 pyinstrument 时可改用它，但只涵盖主线程（工作线程显示为等待时间）
+class RefreshProfiler:
+    def __init__(self, kind="cProfile"):
+        self.kind = kind
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._main = None
+
+    @staticmethod
+    def available():
+        kinds = ["cProfile"]
+        try:
+            import pyinstrument  # noqa: F401
+            kinds.append("pyinstrument")
+        except ImportError:
+            pass
+        return kinds
+
+    @contextmanager
+    def capture(self):
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler
+            self._main = Profiler()
+            self._main.start()
+            try:
+                yield self
+            finally:
+                self._main.stop()
+            return
+        self._main = cProfile.Profile()
+        self._main.enable()
+        try:
+            yield self
+        finally:
+            self._main.disable()
+
+    # 让在线程池中执行的函数也被 cProfile 记录；Python 3.12 起 cProfile 改用 sys.monitoring，
+    # 主线程的剖析已涵盖所有线程，且不能同时启用第二个
+    def wrap(self, func):
+        if self.kind != "cProfile" or sys.version_info >= (3, 12):
+            return func
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._profiles.append(profile)
+        return profiled
+
+    def report(self, limit=40):
+        if self.kind == "pyinstrument":
+            return self._main.output_text(unicode=True, color=False)
+        out = io.StringIO()
+        stats = pstats.Stats(self._main, stream=out)
+        for profile in self._profiles:
+            stats.add(profile)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
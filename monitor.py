@@ -0,0 +1,155 @@
+import argparse
+import logging
+import os
+import time
+
+from alerts import AlertDispatcher
+from bar_cache import BarStore
+from fetcher import YFinanceProvider, resolve_previous_close
+from instrumentation import instruments
+from signals import RULES_BY_KEY, analyze_ticker, build_rule_config
+from snapshot_store import DEFAULT_DB_PATH, SnapshotStore
+
+# 无界面监控程序：python -m v2 monitor --tickers "TSLA, NIO" --interval 5m
+# 按间隔定时抓取、计算并发送通知，结果写入 SQLite 快照供页面读取
+
+log = logging.getLogger("monitor")
+
+# 各间隔的监控频率（秒）
+CADENCE = {
+    "1m": 60, "2m": 60, "5m": 144, "15m": 300, "30m": 300,
+    "60m": 600, "90m": 600, "1h": 600, "1d": 1800,
+}
+DEFAULT_CADENCE = 3600
+
+# 由监控程序负责发信的代号：同一 (期间, 间隔) 的快照在两个监控周期内更新过，且该监控程序有寄送 Email；
+# 周期取监控程序记录的实际频率（含 --every），旧快照库没有记录时按间隔的默认频率
+def monitored_tickers(snapshot_store, tickers, period, interval, now=None):
+    settings = snapshot_store.run_settings(period, interval)
+    if settings is None or not settings[1]:
+        return set()
+    cadence = settings[0] or CADENCE.get(interval, DEFAULT_CADENCE)
+    now = time.time() if now is None else now
+    return {ticker for ticker, updated_at in snapshot_store.updated(tickers, period, interval).items()
+            if now - updated_at < 2 * cadence}
+
+# 执行一轮：抓取 → 指标 → 信号 → 通知 → 发布快照
+def run_cycle(tickers, period, interval, bar_store, snapshot_store, provider,
+              price_threshold=80.0, volume_threshold=80.0, dispatcher=None, rule_config=None, cadence=None):
+    started = time.perf_counter()
+    frames, fetch_errors = bar_store.refresh(tickers, period, interval, provider=provider)
+    results = {}
+    for ticker in tickers:
+        if ticker in fetch_errors:
+            log.warning("無法取得 %s 的資料：%s", ticker, fetch_errors[ticker])
+            continue
+        data = frames.get(ticker)
+        if data is None or data.empty or len(data) < 2:
+            log.warning("%s 無數據或數據不足（期間：%s，間隔：%s）", ticker, period, interval)
+            continue
+        try:
+            with instruments.stage("prev_close", ticker):
+                previous_close = resolve_previous_close(ticker, data, interval, provider)
+            with instruments.stage("signals", ticker):
+                result = analyze_ticker(ticker, data, previous_close, price_threshold, volume_threshold, rule_config)
+        except Exception:
+            log.exception("%s 分析失敗", ticker)
+            continue
+        results[ticker] = result
+        if result["alert"] and dispatcher is not None:
+            with instruments.stage("alerting", ticker):
+                queued = dispatcher.submit(ticker, result["price_pct_change"], result["volume_pct_change"], result["signals"],
+                                           bar_time=result["bar_time"], price_volume=result["price_volume"],
+                                           config=rule_config)
+            if queued:
+                instruments.count("alerts_queued")
+                log.info("%s 異動已加入 Email 摘要", ticker)
+
+    if dispatcher is not None and dispatcher.flush():
+        log.info("Email 摘要已排入佇列（佇列深度 %d）", dispatcher.queue_depth())
+    elapsed = time.perf_counter() - started
+    instruments.observe("refresh", elapsed)
+    instruments.count("refreshes")
+    snapshot_store.publish(period, interval, results, elapsed, cadence=cadence, emails=dispatcher is not None)
+    log.info("%s/%s：%d/%d 檔完成，耗時 %.2f 秒", period, interval, len(results), len(tickers), elapsed)
+    return results
+
+# --disable / --set 两个选项，监控程序与回测共用
+def add_rule_arguments(parser):
+    parser.add_argument("--disable", action="append", default=[], metavar="RULE",
+                        help=f"停用的訊號規則，可重複指定：{', '.join(RULES_BY_KEY)}")
+    parser.add_argument("--set", action="append", default=[], metavar="RULE.PARAM=VALUE",
+                        help="調整規則參數，如 --set ema_buy.fast=8 --set price_trend_vol_pct_buy.volume_pct=20")
+
+def rule_config_from_args(parser, args):
+    try:
+        return build_rule_config(args.disable, args.set)
+    except ValueError as e:
+        parser.error(str(e))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m v2 monitor", description="股票異動監控程式（無界面）")
+    parser.add_argument("--tickers", default="TSLA, NIO, TSLL", help="股票代號，逗號分隔")
+    parser.add_argument("--period", default="5d", help="時間範圍，如 1d、5d、1mo")
+    parser.add_argument("--interval", action="append", help="資料間隔，可重複指定多個，如 --interval 5m --interval 1h")
+    parser.add_argument("--every", type=float, help="固定監控頻率（秒），預設依間隔而定")
+    parser.add_argument("--price-threshold", type=float, default=80.0, help="價格異動閾值 (%%)")
+    parser.add_argument("--volume-threshold", type=float, default=80.0, help="成交量異動閾值 (%%)")
+    add_rule_arguments(parser)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="快照 SQLite 路徑")
+    parser.add_argument("--cache-dir", help="K 線快取目錄（Parquet）")
+    parser.add_argument("--no-email", action="store_true", help="只更新快照，不發送 Email")
+    parser.add_argument("--metrics-file", help="每輪結束後寫入 Prometheus 文字格式的計時（供 node_exporter textfile 收集）")
+    parser.add_argument("--once", action="store_true", help="每個間隔只執行一輪後結束")
+    args = parser.parse_args(argv)
+    args.rule_config = rule_config_from_args(parser, args)
+    return args
+
+# 先写暂存档再改名，收集程序不会读到写了一半的文件
+def write_metrics(path):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(instruments.prometheus())
+    os.replace(tmp, path)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    tickers = [t.strip().upper() for t in args.tickers.split(",") if t.strip()]
+    intervals = list(dict.fromkeys(args.interval or ["5m"]))
+    cadence = {interval: args.every or CADENCE.get(interval, DEFAULT_CADENCE) for interval in intervals}
+
+    provider = YFinanceProvider()
+    bar_store = BarStore(cache_dir=args.cache_dir)
+    snapshot_store = SnapshotStore(args.db)
+    dispatcher = None if args.no_email else AlertDispatcher().start()
+    log.info("監控 %d 檔，期間 %s，間隔 %s，快照寫入 %s", len(tickers), args.period,
+             "、".join(f"{i}（每 {cadence[i]:g} 秒）" for i in intervals), args.db)
+
+    next_run = {interval: time.monotonic() for interval in intervals}
+    try:
+        while True:
+            for interval in intervals:
+                if time.monotonic() >= next_run[interval]:
+                    run_cycle(tickers, args.period, interval, bar_store, snapshot_store, provider,
+                              args.price_threshold, args.volume_threshold, dispatcher=dispatcher,
+                              rule_config=args.rule_config, cadence=cadence[interval])
+                    if args.metrics_file:
+                        write_metrics(args.metrics_file)
+                    # 以计划时间累加，避免每轮耗时让节奏逐渐漂移
+                    next_run[interval] = max(next_run[interval] + cadence[interval], time.monotonic())
+            if args.once:
+                return 0
+            time.sleep(max(0.0, min(next_run.values()) - time.monotonic()))
+    except KeyboardInterrupt:
+        log.info("監控程式已停止")
+        return 0
+    finally:
+        if dispatcher is not None:
+            # 等待队列中的摘要送出
+            dispatcher.close()
+            if dispatcher.last_error is not None:
+                log.error("Email 發送失敗：%s", dispatcher.last_error)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from fetcher import MAX_WORKERS
+
+# 单一代号与整轮刷新的默认期限（秒）
+TICKER_TIMEOUT = 20.0
+REFRESH_DEADLINE = 60.0
+# 逾时的线程无法中止，线程池留足余量，避免卡住的请求占满工作线程
+MAX_THREADS = 64
+
+class TickerTimeout(TimeoutError):
+    pass
+
+# 一轮刷新的统计：第一档完成时间、总耗时与逾时代号
+class RefreshReport:
+    def __init__(self, tickers):
+        self.tickers = list(tickers)
+        self.first_ready = None
+        self.elapsed = None
+        self.timed_out = []
+        self.failed = []
+
+# 并行处理每个代号：load(ticker) 在线程中执行，完成一档就立刻调用 on_ready(ticker, result, error)，
+# 单档超过 ticker_timeout 或整轮超过 deadline 时以 TickerTimeout 通知，不再等待
+async def refresh_async(tickers, load, on_ready, ticker_timeout=TICKER_TIMEOUT,
+                        deadline=REFRESH_DEADLINE, max_workers=MAX_WORKERS):
+    tickers = list(dict.fromkeys(tickers))
+    report = RefreshReport(tickers)
+    if not tickers:
+        report.elapsed = 0.0
+        return report
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=min(MAX_THREADS, len(tickers)))
+    semaphore = asyncio.Semaphore(max_workers)
+    started = time.perf_counter()
+    pending = set(tickers)
+
+    async def run_one(ticker):
+        # 取得并发名额后才开始计时，排队时间不算入单档期限
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(loop.run_in_executor(executor, load, ticker), ticker_timeout)
+                return ticker, result, None
+            except asyncio.TimeoutError:
+                return ticker, None, TickerTimeout(f"{ticker} 超過 {ticker_timeout:g} 秒未回應")
+            except Exception as e:
+                return ticker, None, e
+
+    def finish(ticker, result, error):
+        pending.discard(ticker)
+        if report.first_ready is None:
+            report.first_ready = time.perf_counter() - started
+        if isinstance(error, TickerTimeout):
+            report.timed_out.append(ticker)
+        elif error is not None:
+            report.failed.append(ticker)
+        on_ready(ticker, result, error)
+
+    tasks = [asyncio.create_task(run_one(ticker)) for ticker in tickers]
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline):
+            finish(*await next_done)
+    except asyncio.TimeoutError:
+        for ticker in [t for t in tickers if t in pending]:
+            finish(ticker, None, TickerTimeout(f"{ticker} 未在本輪期限 {deadline:g} 秒內完成"))
+    finally:
+        for task in tasks:
+            task.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+    report.elapsed = time.perf_counter() - started
+    return report
+
+# 同步入口：Streamlit 脚本在主线程执行，on_ready 因此可以直接绘制页面元素
+def run_refresh(tickers, load, on_ready, **kwargs):
+    return asyncio.run(refresh_async(tickers, load, on_ready, **kwargs))
+
+# 最近多轮刷新耗时的中位数与 p95（秒）
+def latency_summary(latencies):
+    if not latencies:
+        return None, None
+    values = np.asarray(latencies, dtype=float)
+    return float(np.percentile(values, 50)), float(np.percentile(values, 95))
@@ -0,0 +1,271 @@
+import io
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from fetcher import fetch_watchlist
+from indicators import ROLLING_WINDOW
+from signals import FrameContext, enabled_rules, evaluate_rules, mark_signals, rule_params, with_thresholds
+
+# 全市场筛选：每个代号只保留规则需要的最新状态（当前与前一根 K 线）与接续计算所需的最后几笔收盘价、成交量，
+# 全部存放在 (代号数, 列数) 的 float64 数组；新 K 线对所有代号一次向量化递推，所有规则也对整个清单一次评估
+
+# 规则用到的列与 EMA 状态；EMA 规则改用其他周期时另外加上 EMA{span}
+STATE_COLUMNS = [
+    "High", "Low", "Close", "Volume", "Price Change %", "Volume Change %", "前5均量",
+    "📈 股價漲跌幅 (%)", "📊 成交量變動幅 (%)", "MACD", "Signal", "EMA5", "EMA10", "EMA12", "EMA26",
+]
+# 接续计算涨跌幅与前 5 笔均值需要的收盘价、成交量笔数
+TAIL_ROWS = ROLLING_WINDOW + 1
+# 每批抓取的代号数；yf.download 不能并行调用，各批依序抓取
+CHUNK_SIZE = 200
+BAR_FIELDS = ["High", "Low", "Close", "Volume"]
+
+# 规则设定需要的 EMA 周期
+def ema_spans(config=None):
+    spans = set()
+    for rule in enabled_rules(config):
+        params = rule_params(rule, config)
+        spans.update(int(params[name]) for name in ("fast", "slow") if name in params)
+    return sorted(spans)
+
+# 解析代号清单：文字以逗号、空白或换行分隔；CSV 取 Symbol/Ticker 列，没有时取第一列
+def parse_universe(text="", csv_bytes=None):
+    tickers = [t.upper() for t in re.split(r"[,\s]+", text or "") if t]
+    if csv_bytes:
+        table = pd.read_csv(io.BytesIO(csv_bytes), dtype=str)
+        column = next((c for c in table.columns if c.strip().lower() in ("symbol", "ticker", "代號")), table.columns[0])
+        tickers += [t.strip().upper() for t in table[column].dropna() if t.strip()]
+    return list(dict.fromkeys(tickers))
+
+# 取出单一代号的 K 线数组：(UTC 时间戳, 最后一笔的当地时间, High/Low/Close/Volume)；
+# 批量下载为对齐而补上的全空列一并去掉，没有资料时返回 None
+def bar_arrays(frame):
+    if frame is None or frame.empty:
+        return None
+    if not isinstance(frame.index, pd.DatetimeIndex):
+        frame = frame.set_index("Datetime" if "Datetime" in frame.columns else "Date")
+    # 整张表一次转成数组再取列，比逐列取 Series 快得多（代号多、每档只有一两笔新 K 线时尤其明显）
+    columns = list(frame.columns)
+    values = frame.to_numpy(dtype=float)[:, [columns.index(c) for c in ["Open"] + BAR_FIELDS]]
+    stamps = frame.index.asi8
+    keep = ~np.isnan(values[:, :4]).all(axis=1)
+    if not keep.all():
+        if not keep.any():
+            return None
+        stamps, values = stamps[keep], values[keep]
+    last = pd.Timestamp(stamps[-1], tz=frame.index.tz)
+    return stamps, (last.tz_localize(None) if last.tzinfo else last).to_datetime64(), values[:, 1:]
+
+# 最新状态数组：每个代号占 2 × 列数 × 8 字节（当前、前一根）+ 2 × TAIL_ROWS × 8 字节（最后几笔收盘价、成交量）
+# + 16 字节（K 线时间），预设 15 列时为 352 字节；加上代号字符串与索引字典，
+# bench.py screener 以 tracemalloc 量得每档约 460 字节，5,000 档约 2.3 MB
+class ScreenerState:
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.positions = {name: i for i, name in enumerate(self.columns)}
+        self.spans = [int(name[3:]) for name in self.columns if name.startswith("EMA")]
+        self.tickers = []
+        self.index = {}
+        self.current = np.empty((0, len(self.columns)))
+        self.previous = np.empty((0, len(self.columns)))
+        self.closes = np.empty((0, TAIL_ROWS))
+        self.volumes = np.empty((0, TAIL_ROWS))
+        # 当前 K 线的 UTC 时间戳（比对新资料用）与当地时间（显示用）
+        self.stamps = np.empty(0, dtype=np.int64)
+        self.bar_time = np.empty(0, dtype="datetime64[ns]")
+
+    def __len__(self):
+        return len(self.tickers)
+
+    @property
+    def bytes_per_symbol(self):
+        return 2 * len(self.columns) * 8 + 2 * TAIL_ROWS * 8 + 16
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.current, self.previous, self.closes, self.volumes, self.stamps, self.bar_time))
+
+    def rows(self, tickers):
+        return np.array([self.index[t] for t in tickers if t in self.index], dtype=int)
+
+    # 各代号当前 K 线的 UTC 时间，下一次只需抓取此时间之后（含）的资料
+    def last_stamp(self, tickers):
+        return self.stamps[self.rows(tickers)].min() if tickers else None
+
+    def _grow(self, tickers):
+        for ticker in tickers:
+            self.index[ticker] = len(self.tickers)
+            self.tickers.append(ticker)
+        empty = np.full((len(tickers), len(self.columns)), np.nan)
+        tail = np.full((len(tickers), TAIL_ROWS), np.nan)
+        self.current = np.vstack([self.current, empty])
+        self.previous = np.vstack([self.previous, empty])
+        self.closes = np.vstack([self.closes, tail])
+        self.volumes = np.vstack([self.volumes, tail])
+        self.stamps = np.concatenate([self.stamps, np.full(len(tickers), np.iinfo(np.int64).min)])
+        self.bar_time = np.concatenate([self.bar_time, np.full(len(tickers), np.datetime64("NaT"), dtype="datetime64[ns]")])
+
+    # 写入新 K 线：bars 为 {代号: bar_arrays(...)}。早于当前 K 线的资料丢弃，与当前 K 线时间相同的
+    # （尚未收盘）先退回前一根的状态再重算；之后按笔数逐步递推，每一步对所有还有新 K 线的代号一次计算
+    def update(self, bars):
+        bars = {t: b for t, b in bars.items() if b is not None}
+        self._grow([t for t in bars if t not in self.index])
+        rows, counts, revised, series, last_times = [], [], [], [], []
+        for ticker, (stamps, last_time, values) in bars.items():
+            row = self.index[ticker]
+            first = int(np.searchsorted(stamps, self.stamps[row]))
+            if first == len(stamps):
+                continue
+            rows.append(row)
+            counts.append(len(stamps) - first)
+            revised.append(stamps[first] == self.stamps[row])
+            series.append(values[first:])
+            self.stamps[row] = stamps[-1]
+            last_times.append(last_time)
+        if not rows:
+            return
+        rows, counts, revised = np.array(rows), np.array(counts), np.array(revised)
+        self.bar_time[rows] = last_times
+        self._rollback(rows[revised])
+        # 补齐成 (代号数, 最多笔数, 4) 的数组，第 step 步处理第 step 笔新 K 线
+        padded = np.full((len(rows), counts.max(), len(BAR_FIELDS)), np.nan)
+        for i, values in enumerate(series):
+            padded[i, :len(values)] = values
+        for step in range(counts.max()):
+            active = counts > step
+            self._advance(rows[active], padded[active, step])
+
+    def _rollback(self, rows):
+        if not len(rows):
+            return
+        self.current[rows] = self.previous[rows]
+        for tail in (self.closes, self.volumes):
+            tail[rows, 1:] = tail[rows, :-1]
+            tail[rows, 0] = np.nan
+
+    # 对 rows 各加一根 K 线（bar 为 High/Low/Close/Volume），算法与 indicators.update_indicators 逐位一致
+    def _advance(self, rows, bar):
+        high, low, close, volume = bar.T
+        column = self.positions
+        state = self.current[rows]
+        closes = np.concatenate([self.closes[rows, 1:], close[:, None]], axis=1)
+        volumes = np.concatenate([self.volumes[rows, 1:], volume[:, None]], axis=1)
+        new = np.empty_like(state)
+        new[:, column["High"]], new[:, column["Low"]] = high, low
+        new[:, column["Close"]], new[:, column["Volume"]] = close, volume
+        with np.errstate(divide="ignore", invalid="ignore"):
+            changes = np.round(closes[:, 1:] / closes[:, :-1] - 1, 4) * 100
+            price_change = changes[:, -1]
+            new[:, column["Price Change %"]] = price_change
+            new[:, column["Volume Change %"]] = np.round(volumes[:, -1] / volumes[:, -2] - 1, 4) * 100
+            mean_change = np.abs(changes).mean(axis=1)
+            mean_volume = volumes[:, 1:].mean(axis=1)
+            new[:, column["前5均量"]] = mean_volume
+            new[:, column["📈 股價漲跌幅 (%)"]] = np.round((np.abs(price_change) - mean_change) / mean_change, 4) * 100
+            new[:, column["📊 成交量變動幅 (%)"]] = np.round((volume - mean_volume) / mean_volume, 4) * 100
+
+        # 收盘价缺值后，EMA 旧值的权重按连续缺值笔数衰减（与 pandas 相同，最多往前看 TAIL_ROWS 笔）
+        observed = ~np.isnan(self.closes[rows])
+        gap = np.where(observed.any(axis=1), np.argmax(observed[:, ::-1], axis=1), TAIL_ROWS)
+        for span in self.spans:
+            position = column[f"EMA{span}"]
+            new[:, position] = _ema_step(state[:, position], close, span, gap)
+        new[:, column["MACD"]] = new[:, column["EMA12"]] - new[:, column["EMA26"]]
+        new[:, column["Signal"]] = _ema_step(state[:, column["Signal"]], new[:, column["MACD"]], 9, 0)
+
+        self.previous[rows] = state
+        self.current[rows] = new
+        self.closes[rows] = closes
+        self.volumes[rows] = volumes
+
+# adjust=False 的 EMA 往前一步，与 indicators.ema 的递推相同：previous 为 NaN 时以新值起算，
+# 新值为 NaN 时沿用前值，gap 为前面已连续缺值的笔数
+def _ema_step(previous, value, span, gap):
+    alpha = 1 / (1 + (span - 1) / 2)
+    old_weight = (1 - alpha) ** (np.asarray(gap) + 1)
+    with np.errstate(invalid="ignore"):
+        blended = (old_weight * previous + alpha * value) / (old_weight + alpha)
+    blended = np.where(previous == value, previous, blended)
+    return np.where(np.isnan(value), previous, np.where(np.isnan(previous), value, blended))
+
+# 让规则在状态数组上评估：col() 取各代号当前值，prev() 取前一根，结果为每个代号一个布尔值
+class UniverseContext(FrameContext):
+    def __init__(self, state, rows):
+        super().__init__(None)
+        self.state = state
+        self.rows = rows
+
+    def col(self, name):
+        return self.shared(("col", name), lambda: self.state.current[self.rows, self.state.positions[name]])
+
+    def prev(self, name):
+        return self.shared(("prev", name), lambda: self.state.previous[self.rows, self.state.positions[name]])
+
+    def ema(self, span):
+        return self.col(f"EMA{span}")
+
+    def prev_ema(self, span):
+        return self.prev(f"EMA{span}")
+
+class Screener:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.state = None
+        self._key = None
+        # 上次刷新的 (设定, 代号清单, 时间)，只改阈值或点选代号时不必重新抓取
+        self._refreshed = None
+        self.errors = {}
+
+    def needs_refresh(self, tickers, period, interval, config=None, max_age=0):
+        if self._refreshed is None:
+            return True
+        key, refreshed_tickers, refreshed_at = self._refreshed
+        return (key != (period, interval, tuple(ema_spans(config))) or refreshed_tickers != tuple(tickers)
+                or time.time() - refreshed_at >= max_age)
+
+    # 分批依序抓取后一次写入状态：尚无状态的代号抓整个期间，其余只抓各批最旧的当前 K 线之后的资料；
+    # 期间、间隔或所需 EMA 周期改变时重新建立
+    def refresh(self, tickers, period, interval, provider=None, config=None):
+        spans = ema_spans(config)
+        key = (period, interval, tuple(spans))
+        if key != self._key:
+            self._key = key
+            self.state = ScreenerState(STATE_COLUMNS + [f"EMA{s}" for s in spans if f"EMA{s}" not in STATE_COLUMNS])
+
+        bars, errors = {}, {}
+        for group in ([t for t in tickers if t not in self.state.index], [t for t in tickers if t in self.state.index]):
+            for chunk in (group[i:i + self.chunk_size] for i in range(0, len(group), self.chunk_size)):
+                stamp = self.state.last_stamp(chunk) if chunk[0] in self.state.index else None
+                start = None if stamp is None else pd.Timestamp(stamp, tz="UTC")
+                frames, chunk_errors = fetch_watchlist(chunk, period, interval, provider=provider, start=start,
+                                                       convert=bar_arrays)
+                bars.update(frames)
+                errors.update(chunk_errors)
+        self.state.update(bars)
+        self._refreshed = (key, tuple(tickers), time.time())
+        self.errors = errors
+        return errors
+
+    # 对清单中有状态的代号一次评估所有规则，返回触发任一规则的代号
+    def scan(self, tickers, price_threshold, volume_threshold, config=None):
+        if self.state is None:
+            return pd.DataFrame()
+        rows = self.state.rows(tickers)
+        flags = pd.DataFrame(evaluate_rules(UniverseContext(self.state, rows),
+                                            with_thresholds(config, price_threshold, volume_threshold)))
+        fired = flags.to_numpy().any(axis=1) if not flags.empty else np.zeros(len(rows), dtype=bool)
+        hit_rows, flags = rows[fired], flags[fired].reset_index(drop=True)
+        column = self.state.positions
+        hits = pd.DataFrame({
+            "代號": [self.state.tickers[r] for r in hit_rows],
+            "K 線時間": self.state.bar_time[hit_rows],
+            "收盤價": self.state.current[hit_rows, column["Close"]],
+            "K 線漲跌 %": self.state.current[hit_rows, column["Price Change %"]],
+            "成交量變動 %": self.state.current[hit_rows, column["Volume Change %"]],
+            "訊號數": flags.sum(axis=1).to_numpy(),
+            "異動標記": mark_signals(flags).to_numpy() if len(flags) else [],
+        })
+        return hits.sort_values(["訊號數", "成交量變動 %"], ascending=False, ignore_index=True)
@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+
+from indicators import ema
+
+# 规则参数在侧边栏显示的名称
+PARAM_LABELS = {
+    "price_threshold": "價格異動閾值 (%)",
+    "volume_threshold": "成交量異動閾值 (%)",
+    "fast": "快線 EMA 週期",
+    "slow": "慢線 EMA 週期",
+    "volume_pct": "成交量變化門檻 (%)",
+}
+# 参数下限：EMA 周期至少为 1
+PARAM_MIN = {"fast": 1, "slow": 1}
+
+# 一条异动规则：键名、表格标签、页面提醒与邮件文字（可引用参数），以及向量化的判断函数
+class Rule:
+    def __init__(self, key, name, label, alert, email, evaluate, params=None):
+        self.key = key
+        self.name = name
+        self.label = label
+        self.alert = alert
+        self.email = email
+        self.evaluate = evaluate
+        self.params = dict(params or {})
+        # 回测用的预期方向：📈 看涨为 1、📉 看跌为 -1，其余只看波动大小
+        self.direction = 1 if label.startswith("📈") else -1 if label.startswith("📉") else 0
+
+# 每张 K 线表一个：移位列、EMA、趋势条件等中间结果只算一次，供所有规则共用
+class FrameContext:
+    def __init__(self, data):
+        self.data = data
+        self._cache = {}
+
+    def shared(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def col(self, name):
+        return self.shared(("col", name), lambda: self.data[name].to_numpy(dtype=float))
+
+    # 前一时段的值；第一笔为 NaN，与之比较的结果自然为 False
+    def prev(self, name):
+        def shift():
+            values = self.col(name)
+            return np.concatenate([[np.nan], values[:-1]])
+        return self.shared(("prev", name), shift)
+
+    def ema(self, span):
+        column = f"EMA{span}"
+        if column in self.data.columns:
+            return self.col(column)
+        return self.shared(("ema", span), lambda: ema(self.col("Close"), span))
+
+    def prev_ema(self, span):
+        column = f"EMA{span}"
+        if column in self.data.columns:
+            return self.prev(column)
+        def shift():
+            values = self.ema(span)
+            return np.concatenate([[np.nan], values[:-1]])
+        return self.shared(("prev_ema", span), shift)
+
+# 共用的中间条件
+def _trend_up(ctx):
+    return ctx.shared("trend_up", lambda: (ctx.col("High") > ctx.prev("High"))
+                      & (ctx.col("Low") > ctx.prev("Low")) & (ctx.col("Close") > ctx.prev("Close")))
+
+def _trend_down(ctx):
+    return ctx.shared("trend_down", lambda: (ctx.col("High") < ctx.prev("High"))
+                      & (ctx.col("Low") < ctx.prev("Low")) & (ctx.col("Close") < ctx.prev("Close")))
+
+def _volume_up(ctx):
+    return ctx.shared("volume_up", lambda: ctx.col("Volume") > ctx.prev("Volume"))
+
+def _above_avg_volume(ctx):
+    return ctx.shared("above_avg_volume", lambda: ctx.col("Volume") > ctx.col("前5均量"))
+
+def _volume_pct_up(ctx, volume_pct):
+    return ctx.shared(("volume_pct_up", volume_pct), lambda: ctx.col("Volume Change %") > volume_pct)
+
+def _ema_cross(ctx, fast, slow, up):
+    def cross():
+        if up:
+            return (ctx.ema(fast) > ctx.ema(slow)) & (ctx.prev_ema(fast) <= ctx.prev_ema(slow))
+        return (ctx.ema(fast) < ctx.ema(slow)) & (ctx.prev_ema(fast) >= ctx.prev_ema(slow))
+    return ctx.shared(("ema_cross", fast, slow, up), cross)
+
+# 规则注册表：新增信号只需在此加一条，表格标记、页面提醒、邮件与侧边栏设定都会自动套用
+RULES = [
+    Rule("volume_price", "量價異動", "✅ 量價", "價格與成交量同時異動", "⚠️ 價格與成交量同時異動！",
+         lambda ctx, price_threshold, volume_threshold:
+             (np.abs(ctx.col("📈 股價漲跌幅 (%)")) >= price_threshold)
+             & (np.abs(ctx.col("📊 成交量變動幅 (%)")) >= volume_threshold),
+         {"price_threshold": 80.0, "volume_threshold": 80.0}),
+    Rule("low_high", "Low>High", "📈 Low>High",
+         "當前最低價高於前一時段最高價", "⚠️ 當前最低價高於前一時段最高價！",
+         lambda ctx: ctx.col("Low") > ctx.prev("High")),
+    Rule("high_low", "High<Low", "📉 High<Low",
+         "當前最高價低於前一時段最低價", "⚠️ 當前最高價低於前一時段最低價！",
+         lambda ctx: ctx.col("High") < ctx.prev("Low")),
+    Rule("macd_buy", "MACD 買入", "📈 MACD買入",
+         "MACD 買入訊號（MACD 線由負轉正）", "📈 MACD 買入訊號：MACD 線由負轉正！",
+         lambda ctx: (ctx.col("MACD") > 0) & (ctx.prev("MACD") <= 0)),
+    Rule("macd_sell", "MACD 賣出", "📉 MACD賣出",
+         "MACD 賣出訊號（MACD 線由正轉負）", "📉 MACD 賣出訊號：MACD 線由正轉負！",
+         lambda ctx: (ctx.col("MACD") <= 0) & (ctx.prev("MACD") > 0)),
+    Rule("ema_buy", "EMA 買入", "📈 EMA買入",
+         "EMA 買入訊號（EMA{fast} 上穿 EMA{slow}，成交量放大）", "📈 EMA 買入訊號：EMA{fast} 上穿 EMA{slow}，成交量放大！",
+         lambda ctx, fast, slow: _ema_cross(ctx, fast, slow, up=True) & _volume_up(ctx),
+         {"fast": 5, "slow": 10}),
+    Rule("ema_sell", "EMA 賣出", "📉 EMA賣出",
+         "EMA 賣出訊號（EMA{fast} 下破 EMA{slow}，成交量放大）", "📉 EMA 賣出訊號：EMA{fast} 下破 EMA{slow}，成交量放大！",
+         lambda ctx, fast, slow: _ema_cross(ctx, fast, slow, up=False) & _volume_up(ctx),
+         {"fast": 5, "slow": 10}),
+    Rule("price_trend_buy", "價格趨勢買入", "📈 價格趨勢買入",
+         "價格趨勢買入訊號（最高價、最低價、收盤價均上漲）", "📈 價格趨勢買入訊號：最高價、最低價、收盤價均上漲！",
+         _trend_up),
+    Rule("price_trend_sell", "價格趨勢賣出", "📉 價格趨勢賣出",
+         "價格趨勢賣出訊號（最高價、最低價、收盤價均下跌）", "📉 價格趨勢賣出訊號：最高價、最低價、收盤價均下跌！",
+         _trend_down),
+    Rule("price_trend_vol_buy", "價格趨勢買入（量）", "📈 價格趨勢買入(量)",
+         "價格趨勢買入訊號（量）（最高價、最低價、收盤價均上漲且成交量放大）",
+         "📈 價格趨勢買入訊號（量）：最高價、最低價、收盤價均上漲且成交量放大！",
+         lambda ctx: _trend_up(ctx) & _above_avg_volume(ctx)),
+    Rule("price_trend_vol_sell", "價格趨勢賣出（量）", "📉 價格趨勢賣出(量)",
+         "價格趨勢賣出訊號（量）（最高價、最低價、收盤價均下跌且成交量放大）",
+         "📉 價格趨勢賣出訊號（量）：最高價、最低價、收盤價均下跌且成交量放大！",
+         lambda ctx: _trend_down(ctx) & _above_avg_volume(ctx)),
+    Rule("price_trend_vol_pct_buy", "價格趨勢買入（量%）", "📈 價格趨勢買入(量%)",
+         "價格趨勢買入訊號（量%）（最高價、最低價、收盤價均上漲且成交量變化 > {volume_pct:g}%）",
+         "📈 價格趨勢買入訊號（量%）：最高價、最低價、收盤價均上漲且成交量變化 > {volume_pct:g}%！",
+         lambda ctx, volume_pct: _trend_up(ctx) & _volume_pct_up(ctx, volume_pct),
+         {"volume_pct": 15.0}),
+    Rule("price_trend_vol_pct_sell", "價格趨勢賣出（量%）", "📉 價格趨勢賣出(量%)",
+         "價格趨勢賣出訊號（量%）（最高價、最低價、收盤價均下跌且成交量變化 > {volume_pct:g}%）",
+         "📉 價格趨勢賣出訊號（量%）：最高價、最低價、收盤價均下跌且成交量變化 > {volume_pct:g}%！",
+         lambda ctx, volume_pct: _trend_down(ctx) & _volume_pct_up(ctx, volume_pct),
+         {"volume_pct": 15.0}),
+]
+RULES_BY_KEY = {rule.key: rule for rule in RULES}
+
+# 规则设定格式：{键名: {"enabled": bool, 参数名: 值}}，未列出的规则与参数沿用默认值
+def rule_params(rule, config=None):
+    params = dict(rule.params)
+    params.update({k: v for k, v in (config or {}).get(rule.key, {}).items() if k != "enabled"})
+    return params
+
+def enabled_rules(config=None, rules=None):
+    config = config or {}
+    return [rule for rule in (RULES if rules is None else rules) if config.get(rule.key, {}).get("enabled", True)]
+
+# 检查启用中规则的参数：低于下限或快线周期不小于慢线周期，返回 {键名: 错误说明}
+def rule_config_errors(config):
+    errors = {}
+    for rule in enabled_rules(config):
+        params = rule_params(rule, config)
+        low = [name for name, value in params.items() if name in PARAM_MIN and value < PARAM_MIN[name]]
+        if low:
+            errors[rule.key] = "、".join(f"{rule.name} 的 {name} 不可小於 {PARAM_MIN[name]}" for name in low)
+        elif "fast" in params and "slow" in params and params["fast"] >= params["slow"]:
+            errors[rule.key] = f"{rule.name} 的快線週期 ({params['fast']}) 須小於慢線週期 ({params['slow']})"
+    return errors
+
+# 由停用清单与 "键名.参数=值" 字串组成规则设定，参数值沿用默认值的类型
+def build_rule_config(disable=(), overrides=()):
+    config = {}
+    for key in disable:
+        if key not in RULES_BY_KEY:
+            raise ValueError(f"未知的訊號規則：{key}")
+        config.setdefault(key, {})["enabled"] = False
+    for item in overrides:
+        name, _, value = item.partition("=")
+        key, _, param = name.partition(".")
+        if key not in RULES_BY_KEY or param not in RULES_BY_KEY[key].params or not value:
+            raise ValueError(f"無效的規則參數：{item}")
+        try:
+            config.setdefault(key, {})[param] = type(RULES_BY_KEY[key].params[param])(value)
+        except ValueError:
+            raise ValueError(f"無效的規則參數：{item}") from None
+    errors = rule_config_errors(config)
+    if errors:
+        raise ValueError("；".join(errors.values()))
+    return config
+
+# 一次评估所有启用的规则，返回 {键名: 布尔数组}
+def evaluate_rules(ctx, config=None, rules=None):
+    return {rule.key: np.asarray(rule.evaluate(ctx, **rule_params(rule, config)), dtype=bool)
+            for rule in enabled_rules(config, rules)}
+
+# 量價规则的门槛取自页面上的价格/成交量阈值
+def with_thresholds(config, price_threshold, volume_threshold):
+    config = {key: dict(value) for key, value in (config or {}).items()}
+    config.setdefault("volume_price", {}).update(price_threshold=price_threshold, volume_threshold=volume_threshold)
+    return config
+
+# 以整列运算一次算出所有 K 线的异动旗标（需先执行 indicators.add_indicators）
+def compute_signals(data, price_threshold, volume_threshold, config=None):
+    config = with_thresholds(config, price_threshold, volume_threshold)
+    return pd.DataFrame(evaluate_rules(FrameContext(data), config), index=data.index)
+
+# 把旗标转换成 "異動標記" 列的文字，如 "📈 MACD買入, 📈 EMA買入"
+# 同一种旗标组合只拼接一次文字，成本不再随 K 线数 × 规则数的字串运算增长
+def mark_signals(flags):
+    if flags.columns.empty or flags.empty:
+        return pd.Series("", index=flags.index, dtype=object)
+    labels = [RULES_BY_KEY[key].label for key in flags.columns]
+    values = flags.to_numpy(dtype=bool)
+    # 每 62 条规则编码成一个整数，规则更多时再对各段编码找出不同组合
+    codes = np.column_stack([values[:, i:i + 62] @ (1 << np.arange(values[:, i:i + 62].shape[1], dtype=np.int64))
+                             for i in range(0, values.shape[1], 62)])
+    codes = codes[:, 0] if codes.shape[1] == 1 else np.unique(codes, axis=0, return_inverse=True)[1].reshape(-1)
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    texts = np.array([", ".join(label for label, fired in zip(labels, combo) if fired) for combo in values[first]],
+                     dtype=object)
+    return pd.Series(texts[inverse], index=flags.index, dtype=object)
+
+# 最后一笔 K 线触发的规则键名（量價另以当前涨跌幅判断）
+def latest_signals(flags):
+    last = flags.iloc[-1]
+    return [key for key in flags.columns if key != "volume_price" and last[key]]
+
+# 计算单一代号的当前资料与异动结果，页面与监控程序共用
+def analyze_ticker(ticker, data, previous_close, price_threshold, volume_threshold, config=None):
+    flags = compute_signals(data, price_threshold, volume_threshold, config)
+    # assign 在写入时复制（copy-on-write），缓存的 K 线不会被改动，也不必每次整份深复制
+    data = data.assign(**{"異動標記": mark_signals(flags)})
+
+    current_price = data["Close"].iloc[-1]
+    price_change = current_price - previous_close
+    price_pct_change = (price_change / previous_close) * 100 if previous_close else 0
+
+    last_volume = data["Volume"].iloc[-1]
+    prev_volume = data["Volume"].iloc[-2] if len(data) > 1 else last_volume
+    volume_change = last_volume - prev_volume
+    volume_pct_change = (volume_change / prev_volume) * 100 if prev_volume else 0
+
+    signals = latest_signals(flags)
+    price_volume = ("volume_price" in flags.columns and abs(price_pct_change) >= price_threshold
+                    and abs(volume_pct_change) >= volume_threshold)
+    alert = price_volume or bool(signals)
+    return {
+        "ticker": ticker,
+        "data": data,
+        "bar_time": data["Datetime"].iloc[-1],
+        "current_price": current_price,
+        "price_change": price_change,
+        "price_pct_change": price_pct_change,
+        "last_volume": last_volume,
+        "volume_change": volume_change,
+        "volume_pct_change": volume_pct_change,
+        "signals": signals,
+        "config": config,
+        "price_volume": price_volume,
+        "alert": alert,
+    }
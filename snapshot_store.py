@@ -0,0 +1,108 @@
+import os
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# 监控程序与页面共用的本地快照库
+DEFAULT_DB_PATH = os.getenv("SNAPSHOT_DB", "snapshots.db")
+
+# 以 SQLite 保存每个 (代号, 期间, 间隔) 最新一次的分析结果；
+# 监控程序是唯一写入者，页面只读取，WAL 模式下读写互不阻塞
+class SnapshotStore:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS snapshots (
+                    ticker TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    interval TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    payload BLOB NOT NULL,
+                    PRIMARY KEY (ticker, period, interval)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    period TEXT NOT NULL,
+                    interval TEXT NOT NULL,
+                    finished_at REAL NOT NULL,
+                    tickers INTEGER NOT NULL,
+                    elapsed REAL NOT NULL,
+                    cadence REAL,
+                    emails INTEGER NOT NULL DEFAULT 1,
+                    PRIMARY KEY (period, interval)
+                )
+            """)
+            # 旧版快照库没有监控频率与是否发信两列，补上
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+            if "cadence" not in columns:
+                conn.execute("ALTER TABLE runs ADD COLUMN cadence REAL")
+            if "emails" not in columns:
+                conn.execute("ALTER TABLE runs ADD COLUMN emails INTEGER NOT NULL DEFAULT 1")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # 写入一轮结果；payload 为 analyze_ticker 的结果（含 DataFrame），只在本机进程间交换。
+    # cadence 为监控程序实际的执行频率（秒），emails 表示这个监控程序是否寄送 Email
+    def publish(self, period, interval, results, elapsed=0.0, cadence=None, emails=True):
+        now = time.time()
+        rows = [(ticker, period, interval, now, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+                for ticker, result in results.items()]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT OR REPLACE INTO runs (period, interval, finished_at, tickers, elapsed, cadence, emails) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (period, interval, now, len(results), elapsed, cadence, int(emails)))
+
+    # 读取指定代号的最新快照，返回 {代号: (更新时间, 结果)}
+    def latest(self, tickers, period, interval):
+        tickers = list(tickers)
+        if not tickers:
+            return {}
+        marks = ",".join("?" * len(tickers))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT ticker, updated_at, payload FROM snapshots "
+                f"WHERE period = ? AND interval = ? AND ticker IN ({marks})",
+                [period, interval, *tickers],
+            ).fetchall()
+        return {ticker: (updated_at, pickle.loads(payload)) for ticker, updated_at, payload in rows}
+
+    # 各代号快照的更新时间（不读取 payload），返回 {代号: 更新时间}
+    def updated(self, tickers, period, interval):
+        tickers = list(tickers)
+        if not tickers:
+            return {}
+        marks = ",".join("?" * len(tickers))
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT ticker, updated_at FROM snapshots WHERE period = ? AND interval = ? AND ticker IN ({marks})",
+                [period, interval, *tickers],
+            ).fetchall()
+        return dict(rows)
+
+    # 最近一轮监控的执行频率与是否寄送 Email，尚未执行过时返回 None
+    def run_settings(self, period, interval):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT cadence, emails FROM runs WHERE period = ? AND interval = ?", (period, interval),
+            ).fetchone()
+
+    # 最近一轮监控的完成时间与耗时，尚未执行过时返回 None
+    def last_run(self, period, interval):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT finished_at, tickers, elapsed FROM runs WHERE period = ? AND interval = ?",
+                (period, interval),
+            ).fetchone()
+        return row
@@ -1,86 +1,131 @@
+import sys
+from collections import deque
+
+if __name__ == "__main__" and sys.argv[1:2] == ["monitor"]:
+    # python -m v2 monitor：不启动页面，只执行无界面的监控程序
+    from monitor import main
+    sys.exit(main(sys.argv[2:]))
+
+if __name__ == "__main__" and sys.argv[1:2] == ["backtest"]:
+    # python -m v2 backtest：离线回测已缓存的 K 线文件
+    from backtest import main
+    sys.exit(main(sys.argv[2:]))
+
 import streamlit as st
-import yfinance as yf
-import pandas as pd
 from datetime import datetime
+from contextlib import nullcontext
+from functools import partial
 import time
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from dotenv import load_dotenv
 import os
-import plotly.express as px
+from alerts import RECIPIENT_EMAIL, AlertDispatcher, build_alert_message
+from bar_cache import BarStore
+from charts import CHART_MODES, GRID_MODE, ChartCache, sparkline_table
+from exports import EXPORT_FORMATS, export_watchlist
+from instrumentation import RefreshProfiler, instruments
+from fetcher import YFinanceProvider, resolve_previous_close
+from monitor import monitored_tickers
+from pipeline import REFRESH_DEADLINE, TICKER_TIMEOUT, TickerTimeout, latency_summary, run_refresh
+from screener import Screener, parse_universe
+from signals import PARAM_LABELS, PARAM_MIN, RULES, analyze_ticker, rule_config_errors
+from snapshot_store import DEFAULT_DB_PATH, SnapshotStore
 
 st.set_page_config(page_title="股票監控儀表板", layout="wide")
 
-load_dotenv()
 # 异动阈值设定
 REFRESH_INTERVAL = 144  # 秒，5 分钟自动刷新
+SNAPSHOT_POLL_INTERVAL = 15  # 秒，读取监控程序快照的频率
+# K 线与指标在此时间（秒）内视为最新：调整阈值、窗口、规则或图表模式时只重算信号，不重新抓取
+BAR_TTL = 60
 
-# Gmail 发信者帐号设置
-SENDER_EMAIL = os.getenv("SENDER_EMAIL")
-SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
-RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL")
-
-# MACD 计算函数
-def calculate_macd(data, fast=12, slow=26, signal=9):
-    exp1 = data["Close"].ewm(span=fast, adjust=False).mean()
-    exp2 = data["Close"].ewm(span=slow, adjust=False).mean()
-    macd = exp1 - exp2
-    signal_line = macd.ewm(span=signal, adjust=False).mean()
-    return macd, signal_line
-
-# 邮件发送函数
-def send_email_alert(ticker, price_pct, volume_pct, low_high_signal=False, high_low_signal=False, 
-                     macd_buy_signal=False, macd_sell_signal=False, ema_buy_signal=False, ema_sell_signal=False,
-                     price_trend_buy_signal=False, price_trend_sell_signal=False,
-                     price_trend_vol_buy_signal=False, price_trend_vol_sell_signal=False,
-                     price_trend_vol_pct_buy_signal=False, price_trend_vol_pct_sell_signal=False):
-    subject = f"📣 股票異動通知：{ticker}"
-    body = f"""
-    股票代號：{ticker}
-    股價變動：{price_pct:.2f}%
-    成交量變動：{volume_pct:.2f}%
-    """
-    if low_high_signal:
-        body += f"\n⚠️ 當前最低價高於前一時段最高價！"
-    if high_low_signal:
-        body += f"\n⚠️ 當前最高價低於前一時段最低價！"
-    if macd_buy_signal:
-        body += f"\n📈 MACD 買入訊號：MACD 線由負轉正！"
-    if macd_sell_signal:
-        body += f"\n📉 MACD 賣出訊號：MACD 線由正轉負！"
-    if ema_buy_signal:
-        body += f"\n📈 EMA 買入訊號：EMA5 上穿 EMA10，成交量放大！"
-    if ema_sell_signal:
-        body += f"\n📉 EMA 賣出訊號：EMA5 下破 EMA10，成交量放大！"
-    if price_trend_buy_signal:
-        body += f"\n📈 價格趨勢買入訊號：最高價、最低價、收盤價均上漲！"
-    if price_trend_sell_signal:
-        body += f"\n📉 價格趨勢賣出訊號：最高價、最低價、收盤價均下跌！"
-    if price_trend_vol_buy_signal:
-        body += f"\n📈 價格趨勢買入訊號（量）：最高價、最低價、收盤價均上漲且成交量放大！"
-    if price_trend_vol_sell_signal:
-        body += f"\n📉 價格趨勢賣出訊號（量）：最高價、最低價、收盤價均下跌且成交量放大！"
-    if price_trend_vol_pct_buy_signal:
-        body += f"\n📈 價格趨勢買入訊號（量%）：最高價、最低價、收盤價均上漲且成交量變化 > 15%！"
-    if price_trend_vol_pct_sell_signal:
-        body += f"\n📉 價格趨勢賣出訊號（量%）：最高價、最低價、收盤價均下跌且成交量變化 > 15%！"
-    
-    body += "\n系統偵測到異常變動，請立即查看市場情況。"
-    msg = MIMEMultipart()
-    msg["From"] = SENDER_EMAIL
-    msg["To"] = RECIPIENT_EMAIL
-    msg["Subject"] = subject
-    msg.attach(MIMEText(body, "plain"))
+LIVE_SOURCE = "即時抓取"
+SNAPSHOT_SOURCE = "監控程式快照"
 
-    try:
-        server = smtplib.SMTP_SSL("smtp.gmail.com", 465)
-        server.login(SENDER_EMAIL, SENDER_PASSWORD)
-        server.sendmail(SENDER_EMAIL, RECIPIENT_EMAIL, msg.as_string())
-        server.quit()
-        st.toast(f"📬 Email 已發送給 {RECIPIENT_EMAIL}")
-    except Exception as e:
-        st.error(f"Email 發送失敗：{e}")
+WATCHLIST_VIEW = "自選清單"
+SCREENER_VIEW = "全市場篩選"
+DEFAULT_UNIVERSE = ("AAPL, MSFT, NVDA, AMZN, GOOGL, META, TSLA, AVGO, AMD, NFLX, "
+                    "INTC, QCOM, MU, PLTR, COIN, NIO, TSLL, SOFI, UBER, SHOP")
+
+# 所有页面共用一个背景发信线程与 SMTP 连线，重复信号也跨页面去重
+@st.cache_resource
+def get_alert_dispatcher():
+    return AlertDispatcher().start()
+
+# K 线缓存：所有页面共用，以 (代号, 期间, 间隔) 为键；每次刷新只抓取并重算新增的 K 线（设定 BAR_CACHE_DIR 时同时存盘）
+@st.cache_resource
+def get_bar_store(cache_dir):
+    return BarStore(cache_dir=cache_dir)
+
+# 数据源：共用一个，前一交易日收盘价的查询结果也跨页面缓存
+@st.cache_resource
+def get_provider():
+    return YFinanceProvider()
+
+# 显示单一代号的当前资料、异动提醒、图表、历史资料与下载按钮
+def render_ticker(result, send_alerts=True):
+    ticker = result["ticker"]
+    data = result["data"]
+    price_pct_change = result["price_pct_change"]
+    volume_pct_change = result["volume_pct_change"]
+    render_started = time.perf_counter()
+
+    # 显示当前资料
+    st.metric(f"{ticker} 🟢 股價變動", f"${result['current_price']:.2f}",
+              f"{result['price_change']:.2f} ({price_pct_change:.2f}%)")
+    st.metric(f"{ticker} 🔵 成交量變動", f"{result['last_volume']:,}",
+              f"{result['volume_change']:,} ({volume_pct_change:.2f}%)")
+
+    # 异动提醒 + Email 推播，包含基于成交量变化百分比的价格趋势信号
+    if result["alert"]:
+        alert_started = time.perf_counter()
+        alert_msg = build_alert_message(ticker, price_pct_change, volume_pct_change, result["signals"], result.get("config"))
+        st.warning(f"📣 {alert_msg}")
+        st.toast(f"📣 {alert_msg}")
+        # 放入本轮的 Email 摘要，由背景线程发送
+        if send_alerts and get_alert_dispatcher().submit(ticker, price_pct_change, volume_pct_change, result["signals"],
+                                                         bar_time=result["bar_time"], price_volume=result["price_volume"],
+                                                         config=result.get("config")):
+            st.toast(f"📬 已加入 Email 摘要，將寄給 {RECIPIENT_EMAIL}")
+            instruments.count("alerts_queued")
+        instruments.observe("alerting", time.perf_counter() - alert_started, ticker)
+
+    # 添加价格和成交量折线图；key 固定，每次刷新由前端沿用同一个图表元件更新数据
+    if chart_mode != GRID_MODE:
+        st.subheader(f"📈 {ticker} 價格與成交量趨勢")
+        started = time.perf_counter()
+        chart_key = (ticker, selected_period, selected_interval)
+        fig = chart_cache.figure(chart_key, data, ticker, chart_mode)
+        # 耗时包含 st.plotly_chart 自身的序列化；payload 大小按同样方式量测，图表不变时沿用
+        st.plotly_chart(fig, use_container_width=True, key=f"chart_{ticker}")
+        elapsed = time.perf_counter() - started
+        chart_stats.append((chart_cache.payload_size(chart_key), elapsed))
+        instruments.observe("chart", elapsed, ticker)
+
+    # 显示含异动标记的历史资料
+    st.subheader(f"📋 歷史資料：{ticker}")
+    display_data = data[["Datetime","Low","High", "Close", "Volume", "Price Change %", 
+                         "Volume Change %", "📈 股價漲跌幅 (%)", 
+                         "📊 成交量變動幅 (%)","Close_Difference", "異動標記"]].tail(15)
+    if not display_data.empty:
+        st.dataframe(
+            display_data,
+            height=600,
+            use_container_width=True,
+            column_config={
+                "異動標記": st.column_config.TextColumn(width="large")
+            }
+        )
+    else:
+        st.warning(f"⚠️ {ticker} 歷史數據表無內容可顯示")
+
+    # 添加下载按钮；CSV 在点击时才生成，刷新时不再为每档建立整份字串
+    st.download_button(
+        label=f"📥 下載 {ticker} 數據 (CSV)",
+        data=instruments.wrap("export", partial(data.to_csv, index=False), ticker),
+        file_name=f"{ticker}_數據_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime="text/csv",
+        on_click="ignore",
+    )
+    instruments.observe("render", time.perf_counter() - render_started, ticker)
 
 # UI 设定
 #period_options = ["1d", "5d", "1mo", "3mo", "6mo", "1y"]
@@ -90,246 +135,301 @@ interval_options = ["1m", "5m", "2m", "15m", "30m", "60m", "90m", "1h", "1d", "5
 
 st.title("📊 股票監控儀表板（含異動提醒與 Email 通知 ✅）")
 input_tickers = st.text_input("請輸入股票代號（逗號分隔）", value="TSLA, NIO, TSLL")
-selected_tickers = [t.strip().upper() for t in input_tickers.split(",") if t.strip()]
+selected_tickers = list(dict.fromkeys(t.strip().upper() for t in input_tickers.split(",") if t.strip()))
 selected_period = st.selectbox("選擇時間範圍", period_options, index=1)
 selected_interval = st.selectbox("選擇資料間隔", interval_options, index=1)
 window_size = st.slider("滑動平均窗口大小", min_value=2, max_value=40, value=5)
 PRICE_THRESHOLD = st.number_input("價格異動閾值 (%)", min_value=0.1, max_value=200.0, value=80.0, step=0.1)
 VOLUME_THRESHOLD = st.number_input("成交量異動閾值 (%)", min_value=0.1, max_value=200.0, value=80.0, step=0.1)
+# 监控程序正以相同期间与间隔监控的代号：全部涵盖时默认读取快照；即使切回即时抓取，
+# 这些代号的 Email 也只由监控程序发送，同一信号不会寄出两封，其余代号仍由本页发送
+monitored = (monitored_tickers(SnapshotStore(), selected_tickers, selected_period, selected_interval)
+             if os.path.exists(DEFAULT_DB_PATH) else set())
+data_source = st.sidebar.radio(
+    "資料來源", [LIVE_SOURCE, SNAPSHOT_SOURCE], index=1 if selected_tickers and monitored >= set(selected_tickers) else 0,
+    help="監控程式快照：讀取 `python -m v2 monitor` 寫入的結果，頁面本身不抓取資料也不發信，閾值以監控程式設定為準",
+)
+ticker_timeout = st.sidebar.number_input("單檔逾時 (秒)", min_value=1.0, max_value=120.0, value=TICKER_TIMEOUT, step=1.0)
+refresh_deadline = st.sidebar.number_input("整輪刷新期限 (秒)", min_value=1.0, max_value=600.0, value=REFRESH_DEADLINE, step=1.0)
+chart_mode = st.sidebar.radio(
+    "圖表模式", CHART_MODES,
+    help="WebGL：完整歷史降採樣至固定點數；SVG：原版最近 50 筆；迷你走勢總覽：所有代號一張表，不逐檔繪圖",
+)
+view = st.sidebar.radio(
+    "檢視", [WATCHLIST_VIEW, SCREENER_VIEW],
+    help="全市場篩選：對整份代號清單只保留最新指標狀態，一次向量化評估所有規則，點選代號再展開完整圖表；一律即時抓取",
+)
+if view == SCREENER_VIEW:
+    universe_text = st.sidebar.text_area("篩選清單（逗號或換行分隔）", value=DEFAULT_UNIVERSE, height=150)
+    universe_file = st.sidebar.file_uploader("或上傳代號 CSV（Symbol / Ticker 欄）", type="csv")
+# 信号规则：逐条开关并调整参数（量價规则的门槛即上方两个阈值）
+rule_config = {}
+with st.sidebar.expander("🧩 訊號規則"):
+    for rule in RULES:
+        settings = {"enabled": st.checkbox(rule.name, value=True, key=f"rule_{rule.key}")}
+        if rule.key != "volume_price":
+            for param, default in rule.params.items():
+                settings[param] = st.number_input(f"{rule.name}：{PARAM_LABELS.get(param, param)}", value=default,
+                                                  min_value=PARAM_MIN.get(param), key=f"rule_{rule.key}_{param}",
+                                                  disabled=not settings["enabled"])
+        rule_config[rule.key] = settings
+    # 参数不合理的规则（如快线周期不小于慢线）先停用，其余规则照常计算
+    for key, error in rule_config_errors(rule_config).items():
+        st.warning(f"⚠️ {error}，已暫停此規則")
+        rule_config[key]["enabled"] = False
 
 placeholder = st.empty()
+provider = get_provider()
+bar_store = get_bar_store(os.getenv("BAR_CACHE_DIR"))
+# 逾时代号改显示上一轮结果；保留最近几轮的刷新耗时以计算 p95
+last_results = st.session_state.setdefault("last_results", {})
+refresh_latencies = st.session_state.setdefault("refresh_latencies", deque(maxlen=50))
+snapshot_store = SnapshotStore() if data_source == SNAPSHOT_SOURCE else None
+# 全部代号汇出：点击时才从 K 线缓存（或监控快照）逐档读取并写成单一文件
+def export_frames():
+    if snapshot_store is not None:
+        snapshots = snapshot_store.latest(selected_tickers, selected_period, selected_interval)
+        return {ticker: snapshots[ticker][1]["data"] for ticker in selected_tickers if ticker in snapshots}
+    return {ticker: bar_store.get(ticker, selected_period, selected_interval) for ticker in selected_tickers}
 
-while True:
-    with placeholder.container():
-        st.subheader(f"⏱ 更新時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+export_format = st.sidebar.selectbox("匯出格式", list(EXPORT_FORMATS))
+extension, mime = EXPORT_FORMATS[export_format]
+st.sidebar.download_button(
+    label=f"📦 下載全部代號 ({export_format})",
+    data=partial(export_watchlist, export_frames, export_format),
+    file_name=f"watchlist_{selected_period}_{selected_interval}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+    mime=mime,
+    on_click="ignore",
+)
 
+# 图表缓存：没有新 K 线的代号沿用上次的图表；chart_stats 记录本轮各图的 (payload 字节, 绘制秒数)
+chart_cache = st.session_state.setdefault("chart_cache", ChartCache())
+chart_stats = []
+
+# 所有代号的迷你走势表
+def render_grid(results):
+    started = time.perf_counter()
+    table = sparkline_table(results)
+    st.dataframe(
+        table,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "價格": st.column_config.NumberColumn(format="$%.2f"),
+            "漲跌 %": st.column_config.NumberColumn(format="%.2f%%"),
+            "走勢": st.column_config.LineChartColumn(width="medium"),
+            "異動": st.column_config.TextColumn(width="large"),
+        },
+    )
+    chart_stats.append((len(table.to_json()), time.perf_counter() - started))
+
+# 诊断面板：各阶段耗时百分位数、各代号耗时、计数器、Prometheus 文字与单轮效能剖析
+def render_diagnostics():
+    with st.expander("🩺 診斷", expanded=True):
+        if not instruments.enabled:
+            st.caption("計時已關閉（INSTRUMENTATION=0）")
+        summary = instruments.summary()
+        if not summary.empty:
+            st.dataframe(summary, hide_index=True, use_container_width=True,
+                         column_config={c: st.column_config.NumberColumn(format="%.1f") for c in summary.columns[2:]})
+        tickers = instruments.ticker_table()
+        if not tickers.empty:
+            st.dataframe(tickers, use_container_width=True,
+                         column_config={c: st.column_config.NumberColumn(format="%.1f ms") for c in tickers.columns})
+        counters = instruments.counters()
+        if counters:
+            st.caption("｜".join(f"{name} {value}" for name, value in sorted(counters.items())))
+        prometheus = instruments.prometheus()
+        if st.toggle("Prometheus 文字格式", key="diag_prometheus"):
+            st.code(prometheus, language="text")
+        st.download_button("📥 下載 metrics.prom", data=prometheus, file_name="metrics.prom", mime="text/plain",
+                           on_click="ignore")
+        kind = st.selectbox("剖析工具", RefreshProfiler.available(), key="diag_profiler")
+        if st.button("🔬 剖析下一輪刷新", disabled=snapshot_store is not None):
+            st.session_state.profile_next = kind
+            st.rerun()
+        if "profile_report" in st.session_state:
+            kind, captured_at, report = st.session_state.profile_report
+            st.caption(f"{kind}：{captured_at.strftime('%H:%M:%S')} 的一輪刷新")
+            st.code(report, language="text")
+
+# 全市场筛选：定时增量抓取整份清单，阈值与规则改变时只重新扫描；点选一列展开该代号
+def render_screener():
+    screener = st.session_state.setdefault("screener", Screener())
+    universe = parse_universe(universe_text, universe_file.getvalue() if universe_file is not None else None)
+    if not universe:
+        st.warning("⚠️ 篩選清單是空的")
+        return
+    if screener.needs_refresh(universe, selected_period, selected_interval, rule_config, REFRESH_INTERVAL):
+        with st.spinner(f"正在抓取 {len(universe)} 檔..."), instruments.stage("screener_refresh"):
+            screener.refresh(universe, selected_period, selected_interval, provider=provider, config=rule_config)
+    started = time.perf_counter()
+    with instruments.stage("screener_scan"):
+        hits = screener.scan(universe, PRICE_THRESHOLD, VOLUME_THRESHOLD, rule_config)
+    elapsed = time.perf_counter() - started
+    state = screener.state
+    st.caption(f"🔎 篩選 {len(state)} / {len(universe)} 檔，{len(hits)} 檔觸發訊號｜掃描 {elapsed * 1000:.1f} ms｜"
+               f"狀態陣列 {state.nbytes / 1024:.0f} KB（每檔 {state.bytes_per_symbol} 位元組，不含代號與索引）")
+    if screener.errors:
+        st.caption(f"⚠️ 無法取得 {len(screener.errors)} 檔：{', '.join(sorted(screener.errors)[:20])}")
+    event = st.dataframe(
+        hits,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key="screener_hits",
+        column_config={
+            "收盤價": st.column_config.NumberColumn(format="$%.2f"),
+            "K 線漲跌 %": st.column_config.NumberColumn(format="%.2f%%"),
+            "成交量變動 %": st.column_config.NumberColumn(format="%.2f%%"),
+            "異動標記": st.column_config.TextColumn(width="large"),
+        },
+    )
+    if not event.selection.rows:
+        st.caption("點選一列查看該代號的完整圖表與歷史資料")
+        return
+    # 展开：与自选清单相同的 K 线缓存与分析流程，不发送 Email
+    ticker = hits["代號"].iloc[event.selection.rows[0]]
+    try:
+        frames, fetch_errors = bar_store.refresh([ticker], selected_period, selected_interval, provider=provider,
+                                                 max_age=BAR_TTL)
+        if ticker in fetch_errors:
+            raise fetch_errors[ticker]
+        data = frames[ticker]
+        if data.empty or len(data) < 2:
+            st.warning(f"⚠️ {ticker} 無數據或數據不足")
+            return
+        previous_close = resolve_previous_close(ticker, data, selected_interval, provider)
+        render_ticker(analyze_ticker(ticker, data, previous_close, PRICE_THRESHOLD, VOLUME_THRESHOLD, rule_config),
+                      send_alerts=False)
+    except Exception as e:
+        st.warning(f"⚠️ 無法取得 {ticker} 的資料：{e}")
+
+# 本轮图表的总 payload 与绘制耗时
+def chart_summary():
+    if not chart_stats:
+        return None
+    payload = sum(size for size, _ in chart_stats)
+    elapsed = sum(seconds for _, seconds in chart_stats)
+    return f"📊 {chart_mode}：{len(chart_stats)} 張圖表，每輪送出 payload 共 {payload / 1024:.0f} KB，繪製（含序列化） {elapsed * 1000:.0f} ms"
+
+# 每轮刷新重新执行整个脚本（st.rerun），同一次执行内元素 key 不重复，图表 key 因此可以固定
+with placeholder.container():
+    st.subheader(f"⏱ 更新時間：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    chart_slot = st.empty()
+    grid_slot = st.empty()
+
+    if view == SCREENER_VIEW:
+        render_screener()
+    elif snapshot_store is not None:
+        # 只读取监控程序的最新快照，多个页面共用同一份计算结果
+        snapshots = snapshot_store.latest(selected_tickers, selected_period, selected_interval)
+        last_run = snapshot_store.last_run(selected_period, selected_interval)
+        if last_run:
+            finished_at, ticker_count, elapsed = last_run
+            st.caption(f"🛰 監控程式最近一輪：{datetime.fromtimestamp(finished_at).strftime('%Y-%m-%d %H:%M:%S')}，"
+                       f"{ticker_count} 檔，耗時 {elapsed:.1f} 秒")
         for ticker in selected_tickers:
-            try:
-                stock = yf.Ticker(ticker)
-                data = stock.history(period=selected_period, interval=selected_interval).reset_index()
-
-                # 检查数据是否为空并统一时间列名称
-                if data.empty or len(data) < 2:
-                    st.warning(f"⚠️ {ticker} 無數據或數據不足（期間：{selected_period}，間隔：{selected_interval}），請嘗試其他時間範圍或間隔")
-                    continue
-
-                # 统一时间列名称为 "Datetime"
-                if "Date" in data.columns:
-                    data = data.rename(columns={"Date": "Datetime"})
-                elif "Datetime" not in data.columns:
-                    st.warning(f"⚠️ {ticker} 數據缺少時間列，無法處理")
-                    continue
-
-                # 计算涨跌幅百分比
-                data["Price Change %"] = data["Close"].pct_change().round(4) * 100
-                data["Volume Change %"] = data["Volume"].pct_change().round(4) * 100
-                data["Close_Difference"] = data['Close'].diff().round(2)
-                
-                # 计算前 5 笔平均收盘价与平均成交量
-                data["前5均價"] = data["Price Change %"].rolling(window=5).mean()
-                data["前5均價ABS"] = abs(data["Price Change %"]).rolling(window=5).mean()
-                data["前5均量"] = data["Volume"].rolling(window=5).mean()
-                data["📈 股價漲跌幅 (%)"] = ((abs(data["Price Change %"]) - data["前5均價ABS"]) / data["前5均價ABS"]).round(4) * 100
-                data["📊 成交量變動幅 (%)"] = ((data["Volume"] - data["前5均量"]) / data["前5均量"]).round(4) * 100
-
-                # 计算 MACD
-                data["MACD"], data["Signal"] = calculate_macd(data)
-                
-                # 计算 EMA5 和 EMA10
-                data["EMA5"] = data["Close"].ewm(span=5, adjust=False).mean()
-                data["EMA10"] = data["Close"].ewm(span=10, adjust=False).mean()
-                
-                # 标记量价异动、Low > High、High < Low、MACD、EMA、价格趋势及带成交量条件的价格趋势信号
-                def mark_signal(row, index):
-                    signals = []
-                    if abs(row["📈 股價漲跌幅 (%)"]) >= PRICE_THRESHOLD and abs(row["📊 成交量變動幅 (%)"]) >= VOLUME_THRESHOLD:
-                        signals.append("✅ 量價")
-                    if index > 0 and row["Low"] > data["High"].iloc[index-1]:
-                        signals.append("📈 Low>High")
-                    if index > 0 and row["High"] < data["Low"].iloc[index-1]:
-                        signals.append("📉 High<Low")
-                    if index > 0 and row["MACD"] > 0 and data["MACD"].iloc[index-1] <= 0:
-                        signals.append("📈 MACD買入")
-                    if index > 0 and row["MACD"] <= 0 and data["MACD"].iloc[index-1] > 0:
-                        signals.append("📉 MACD賣出")
-                    if (index > 0 and row["EMA5"] > row["EMA10"] and 
-                        data["EMA5"].iloc[index-1] <= data["EMA10"].iloc[index-1] and 
-                        row["Volume"] > data["Volume"].iloc[index-1]):
-                        signals.append("📈 EMA買入")
-                    if (index > 0 and row["EMA5"] < row["EMA10"] and 
-                        data["EMA5"].iloc[index-1] >= data["EMA10"].iloc[index-1] and 
-                        row["Volume"] > data["Volume"].iloc[index-1]):
-                        signals.append("📉 EMA賣出")
-                    if (index > 0 and row["High"] > data["High"].iloc[index-1] and 
-                        row["Low"] > data["Low"].iloc[index-1] and 
-                        row["Close"] > data["Close"].iloc[index-1]):
-                        signals.append("📈 價格趨勢買入")
-                    if (index > 0 and row["High"] < data["High"].iloc[index-1] and 
-                        row["Low"] < data["Low"].iloc[index-1] and 
-                        row["Close"] < data["Close"].iloc[index-1]):
-                        signals.append("📉 價格趨勢賣出")
-                    if (index > 0 and row["High"] > data["High"].iloc[index-1] and 
-                        row["Low"] > data["Low"].iloc[index-1] and 
-                        row["Close"] > data["Close"].iloc[index-1] and 
-                        row["Volume"] > data["前5均量"].iloc[index]):
-                        signals.append("📈 價格趨勢買入(量)")
-                    if (index > 0 and row["High"] < data["High"].iloc[index-1] and 
-                        row["Low"] < data["Low"].iloc[index-1] and 
-                        row["Close"] < data["Close"].iloc[index-1] and 
-                        row["Volume"] > data["前5均量"].iloc[index]):
-                        signals.append("📉 價格趨勢賣出(量)")
-                    if (index > 0 and row["High"] > data["High"].iloc[index-1] and 
-                        row["Low"] > data["Low"].iloc[index-1] and 
-                        row["Close"] > data["Close"].iloc[index-1] and 
-                        row["Volume Change %"] > 15):
-                        signals.append("📈 價格趨勢買入(量%)")
-                    if (index > 0 and row["High"] < data["High"].iloc[index-1] and 
-                        row["Low"] < data["Low"].iloc[index-1] and 
-                        row["Close"] < data["Close"].iloc[index-1] and 
-                        row["Volume Change %"] > 15):
-                        signals.append("📉 價格趨勢賣出(量%)")
-                    return ", ".join(signals) if signals else ""
-                
-                data["異動標記"] = [mark_signal(row, i) for i, row in data.iterrows()]
-
-                # 当前资料
-                current_price = data["Close"].iloc[-1]
-                previous_close = stock.info.get("previousClose", current_price)
-                price_change = current_price - previous_close
-                price_pct_change = (price_change / previous_close) * 100 if previous_close else 0
-
-                last_volume = data["Volume"].iloc[-1]
-                prev_volume = data["Volume"].iloc[-2] if len(data) > 1 else last_volume
-                volume_change = last_volume - prev_volume
-                volume_pct_change = (volume_change / prev_volume) * 100 if prev_volume else 0
-
-                # 检查 Low > High、High < Low、MACD、EMA、价格趋势及带成交量条件的价格趋势信号
-                low_high_signal = len(data) > 1 and data["Low"].iloc[-1] > data["High"].iloc[-2]
-                high_low_signal = len(data) > 1 and data["High"].iloc[-1] < data["Low"].iloc[-2]
-                macd_buy_signal = len(data) > 1 and data["MACD"].iloc[-1] > 0 and data["MACD"].iloc[-2] <= 0
-                macd_sell_signal = len(data) > 1 and data["MACD"].iloc[-1] <= 0 and data["MACD"].iloc[-2] > 0
-                ema_buy_signal = (len(data) > 1 and 
-                                 data["EMA5"].iloc[-1] > data["EMA10"].iloc[-1] and 
-                                 data["EMA5"].iloc[-2] <= data["EMA10"].iloc[-2] and 
-                                 data["Volume"].iloc[-1] > data["Volume"].iloc[-2])
-                ema_sell_signal = (len(data) > 1 and 
-                                  data["EMA5"].iloc[-1] < data["EMA10"].iloc[-1] and 
-                                  data["EMA5"].iloc[-2] >= data["EMA10"].iloc[-2] and 
-                                  data["Volume"].iloc[-1] > data["Volume"].iloc[-2])
-                price_trend_buy_signal = (len(data) > 1 and 
-                                         data["High"].iloc[-1] > data["High"].iloc[-2] and 
-                                         data["Low"].iloc[-1] > data["Low"].iloc[-2] and 
-                                         data["Close"].iloc[-1] > data["Close"].iloc[-2])
-                price_trend_sell_signal = (len(data) > 1 and 
-                                          data["High"].iloc[-1] < data["High"].iloc[-2] and 
-                                          data["Low"].iloc[-1] < data["Low"].iloc[-2] and 
-                                          data["Close"].iloc[-1] < data["Close"].iloc[-2])
-                price_trend_vol_buy_signal = (len(data) > 1 and 
-                                             data["High"].iloc[-1] > data["High"].iloc[-2] and 
-                                             data["Low"].iloc[-1] > data["Low"].iloc[-2] and 
-                                             data["Close"].iloc[-1] > data["Close"].iloc[-2] and 
-                                             data["Volume"].iloc[-1] > data["前5均量"].iloc[-1])
-                price_trend_vol_sell_signal = (len(data) > 1 and 
-                                              data["High"].iloc[-1] < data["High"].iloc[-2] and 
-                                              data["Low"].iloc[-1] < data["Low"].iloc[-2] and 
-                                              data["Close"].iloc[-1] < data["Close"].iloc[-2] and 
-                                              data["Volume"].iloc[-1] > data["前5均量"].iloc[-1])
-                price_trend_vol_pct_buy_signal = (len(data) > 1 and 
-                                                 data["High"].iloc[-1] > data["High"].iloc[-2] and 
-                                                 data["Low"].iloc[-1] > data["Low"].iloc[-2] and 
-                                                 data["Close"].iloc[-1] > data["Close"].iloc[-2] and 
-                                                 data["Volume Change %"].iloc[-1] > 15)
-                price_trend_vol_pct_sell_signal = (len(data) > 1 and 
-                                                  data["High"].iloc[-1] < data["High"].iloc[-2] and 
-                                                  data["Low"].iloc[-1] < data["Low"].iloc[-2] and 
-                                                  data["Close"].iloc[-1] < data["Close"].iloc[-2] and 
-                                                  data["Volume Change %"].iloc[-1] > 15)
-
-                # 显示当前资料
-                st.metric(f"{ticker} 🟢 股價變動", f"${current_price:.2f}",
-                          f"{price_change:.2f} ({price_pct_change:.2f}%)")
-                st.metric(f"{ticker} 🔵 成交量變動", f"{last_volume:,}",
-                          f"{volume_change:,} ({volume_pct_change:.2f}%)")
-
-                # 异动提醒 + Email 推播，包含基于成交量变化百分比的价格趋势信号
-                if (abs(price_pct_change) >= PRICE_THRESHOLD and abs(volume_pct_change) >= VOLUME_THRESHOLD) or low_high_signal or high_low_signal or macd_buy_signal or macd_sell_signal or ema_buy_signal or ema_sell_signal or price_trend_buy_signal or price_trend_sell_signal or price_trend_vol_buy_signal or price_trend_vol_sell_signal or price_trend_vol_pct_buy_signal or price_trend_vol_pct_sell_signal:
-                    alert_msg = f"{ticker} 異動：價格 {price_pct_change:.2f}%、成交量 {volume_pct_change:.2f}%"
-                    if low_high_signal:
-                        alert_msg += "，當前最低價高於前一時段最高價"
-                    if high_low_signal:
-                        alert_msg += "，當前最高價低於前一時段最低價"
-                    if macd_buy_signal:
-                        alert_msg += "，MACD 買入訊號（MACD 線由負轉正）"
-                    if macd_sell_signal:
-                        alert_msg += "，MACD 賣出訊號（MACD 線由正轉負）"
-                    if ema_buy_signal:
-                        alert_msg += "，EMA 買入訊號（EMA5 上穿 EMA10，成交量放大）"
-                    if ema_sell_signal:
-                        alert_msg += "，EMA 賣出訊號（EMA5 下破 EMA10，成交量放大）"
-                    if price_trend_buy_signal:
-                        alert_msg += "，價格趨勢買入訊號（最高價、最低價、收盤價均上漲）"
-                    if price_trend_sell_signal:
-                        alert_msg += "，價格趨勢賣出訊號（最高價、最低價、收盤價均下跌）"
-                    if price_trend_vol_buy_signal:
-                        alert_msg += "，價格趨勢買入訊號（量）（最高價、最低價、收盤價均上漲且成交量放大）"
-                    if price_trend_vol_sell_signal:
-                        alert_msg += "，價格趨勢賣出訊號（量）（最高價、最低價、收盤價均下跌且成交量放大）"
-                    if price_trend_vol_pct_buy_signal:
-                        alert_msg += "，價格趨勢買入訊號（量%）（最高價、最低價、收盤價均上漲且成交量變化 > 15%）"
-                    if price_trend_vol_pct_sell_signal:
-                        alert_msg += "，價格趨勢賣出訊號（量%）（最高價、最低價、收盤價均下跌且成交量變化 > 15%）"
-                    st.warning(f"📣 {alert_msg}")
-                    st.toast(f"📣 {alert_msg}")
-                    send_email_alert(ticker, price_pct_change, volume_pct_change, low_high_signal, high_low_signal, 
-                                    macd_buy_signal, macd_sell_signal, ema_buy_signal, ema_sell_signal, 
-                                    price_trend_buy_signal, price_trend_sell_signal,
-                                    price_trend_vol_buy_signal, price_trend_vol_sell_signal,
-                                    price_trend_vol_pct_buy_signal, price_trend_vol_pct_sell_signal)
-
-                # 添加价格和成交量折线图
-                st.subheader(f"📈 {ticker} 價格與成交量趨勢")
-                ### 修改 ### 为 st.plotly_chart 添加唯一 key
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                fig = px.line(data.tail(50), x="Datetime", y=["Close", "Volume"], 
-                             title=f"{ticker} 價格與成交量",
-                             labels={"Close": "價格", "Volume": "成交量"},
-                             render_mode="svg")
-                fig.update_layout(yaxis2=dict(overlaying="y", side="right", title="成交量"))
-                st.plotly_chart(fig, use_container_width=True, key=f"chart_{ticker}_{timestamp}")
-
-                # 显示含异动标记的历史资料
-                st.subheader(f"📋 歷史資料：{ticker}")
-                display_data = data[["Datetime","Low","High", "Close", "Volume", "Price Change %", 
-                                     "Volume Change %", "📈 股價漲跌幅 (%)", 
-                                     "📊 成交量變動幅 (%)","Close_Difference", "異動標記"]].tail(15)
-                if not display_data.empty:
-                    st.dataframe(
-                        display_data,
-                        height=600,
-                        use_container_width=True,
-                        column_config={
-                            "異動標記": st.column_config.TextColumn(width="large")
-                        }
-                    )
-                else:
-                    st.warning(f"⚠️ {ticker} 歷史數據表無內容可顯示")
-
-                # 添加下载按钮
-                csv = data.to_csv(index=False)
-                st.download_button(
-                    label=f"📥 下載 {ticker} 數據 (CSV)",
-                    data=csv,
-                    file_name=f"{ticker}_數據_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv",
-                )
-
-            except Exception as e:
-                st.warning(f"⚠️ 無法取得 {ticker} 的資料：{e}，將跳過此股票")
+            if ticker not in snapshots:
+                st.warning(f"⚠️ 尚無 {ticker} 的監控快照（期間：{selected_period}，間隔：{selected_interval}），"
+                           f"請先執行 python -m v2 monitor --tickers {ticker} --period {selected_period} --interval {selected_interval}")
                 continue
+            updated_at, result = snapshots[ticker]
+            st.caption(f"{ticker} 快照時間：{datetime.fromtimestamp(updated_at).strftime('%Y-%m-%d %H:%M:%S')}")
+            render_ticker(result, send_alerts=False)
+        if chart_mode == GRID_MODE:
+            with grid_slot.container():
+                render_grid([snapshots[t][1] for t in selected_tickers if t in snapshots])
+    else:
+        # 每档一个占位区：并行抓取与计算，完成一档就绘制一档，逾时的代号显示上一轮资料
+        stats_slot = st.empty()
+        if monitored:
+            st.caption(f"📭 監控程式執行中，{'、'.join(t for t in selected_tickers if t in monitored)} 的 Email "
+                       f"由監控程式寄送，本頁不重複發信")
+        slots = {}
+        for ticker in selected_tickers:
+            slots[ticker] = st.empty()
+            slots[ticker].caption(f"⏳ {ticker} 載入中...")
+
+        def load_ticker(ticker):
+            # 已缓存的代号只抓新 K 线，BAR_TTL 内刚抓过的直接沿用
+            frames, fetch_errors = bar_store.refresh([ticker], selected_period, selected_interval, provider=provider,
+                                                     max_age=BAR_TTL)
+            if ticker in fetch_errors:
+                raise fetch_errors[ticker]
+            data = frames[ticker]
+            if data.empty or len(data) < 2:
+                return None
+            # 标记量价异动、Low > High、High < Low、MACD、EMA、价格趋势及带成交量条件的价格趋势信号
+            with instruments.stage("prev_close", ticker):
+                previous_close = resolve_previous_close(ticker, data, selected_interval, provider)
+            with instruments.stage("signals", ticker):
+                return analyze_ticker(ticker, data, previous_close, PRICE_THRESHOLD, VOLUME_THRESHOLD, rule_config)
+
+        def show_ticker(ticker, result, error):
+            key = (ticker, selected_period, selected_interval)
+            with slots[ticker].container():
+                try:
+                    if isinstance(error, TickerTimeout):
+                        if key in last_results:
+                            updated_at, stale = last_results[key]
+                            st.warning(f"⏳ {error}，以下為 {datetime.fromtimestamp(updated_at).strftime('%H:%M:%S')} 的舊資料")
+                            render_ticker(stale, send_alerts=False)
+                        else:
+                            st.warning(f"⏳ {error}，暫無資料可顯示")
+                    elif error is not None:
+                        raise error
+                    elif result is None:
+                        st.warning(f"⚠️ {ticker} 無數據或數據不足（期間：{selected_period}，間隔：{selected_interval}），請嘗試其他時間範圍或間隔")
+                    else:
+                        render_ticker(result, send_alerts=ticker not in monitored)
+                        last_results[key] = (time.time(), result)
+                except Exception as e:
+                    st.warning(f"⚠️ 無法取得 {ticker} 的資料：{e}，將跳過此股票")
+
+        # 诊断面板要求时，对这一轮刷新做效能剖析
+        profile_kind = st.session_state.pop("profile_next", None)
+        profiler = RefreshProfiler(profile_kind) if profile_kind else None
+        with profiler.capture() if profiler else nullcontext():
+            report = run_refresh(selected_tickers, profiler.wrap(load_ticker) if profiler else load_ticker, show_ticker,
+                                 ticker_timeout=ticker_timeout, deadline=refresh_deadline)
+        if profiler:
+            st.session_state.profile_report = (profile_kind, datetime.now(), profiler.report())
+        instruments.observe("refresh", report.elapsed)
+        instruments.count("refreshes")
+        instruments.count("tickers_timed_out", len(report.timed_out))
+        instruments.count("tickers_failed", len(report.failed))
+        alert_dispatcher = get_alert_dispatcher()
+        alert_dispatcher.flush()
+        if report.first_ready is not None:
+            refresh_latencies.append(report.elapsed)
+            p50, p95 = latency_summary(refresh_latencies)
+            stats = (f"⚡ 首檔完成 {report.first_ready:.2f} 秒｜本輪 {report.elapsed:.2f} 秒｜"
+                     f"近 {len(refresh_latencies)} 輪 p50 {p50:.2f} 秒、p95 {p95:.2f} 秒")
+            if report.timed_out:
+                stats += f"｜逾時：{', '.join(report.timed_out)}"
+            email = alert_dispatcher.metrics()
+            stats += f"｜📬 Email 佇列 {email['queue_depth']}、已寄 {email['sent']}、略過重複 {email['suppressed']}"
+            if email["p95_latency"] is not None:
+                stats += f"、寄送 p95 {email['p95_latency']:.2f} 秒"
+            stats_slot.caption(stats)
+            if email["last_error"] is not None:
+                st.error(f"Email 發送失敗：{email['last_error']}")
+        if chart_mode == GRID_MODE:
+            keys = [(t, selected_period, selected_interval) for t in selected_tickers]
+            with grid_slot.container():
+                render_grid([last_results[key][1] for key in keys if key in last_results])
+
+    if chart_summary():
+        chart_slot.caption(chart_summary())
 
-        st.markdown("---")
-        st.info("📡 頁面將在 5 分鐘後自動刷新...")
+    st.markdown("---")
+    st.info("📡 頁面將在 5 分鐘後自動刷新...")
 
-    time.sleep(REFRESH_INTERVAL)
-    placeholder.empty()
+    # 隐藏的诊断面板：网址加上 ?diag=1 才显示
+    if st.query_params.get("diag") == "1":
+        render_diagnostics()
 
+time.sleep(SNAPSHOT_POLL_INTERVAL if snapshot_store is not None else REFRESH_INTERVAL)
+st.rerun()